@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Compare the per-call overhead of the permission decorators."""
+
+from __future__ import print_function
+
+import timeit
+
+from rbac.acl import Registry
+from rbac.context import IdentityContext
+
+
+acl = Registry()
+context = IdentityContext(acl, lambda: ["staff", "editor"])
+
+acl.add_role("staff")
+acl.add_role("editor", parents=["staff"])
+acl.add_resource("article")
+acl.allow("staff", "view", "article")
+acl.allow("editor", "edit", "article")
+
+
+def article_page():
+    return "<article>"
+
+
+protected = {
+    "undecorated": article_page,
+    "check_permission": context.check_permission("edit", "article")(
+        article_page),
+    "permission_guard": context.permission_guard("edit", "article")(
+        article_page),
+}
+
+
+def main(number=100000):
+    baseline = min(timeit.repeat(article_page, number=number, repeat=5))
+    for name, func in sorted(protected.items()):
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        print("%-20s %8.3f us/call  (overhead %8.3f us/call)" % (
+            name, elapsed / number * 1e6, (elapsed - baseline) / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Measure the memory of synthetic registries (Python 3.4+)."""
+
+from __future__ import print_function
+
+import gc
+import tracemalloc
+
+from rbac.acl import Registry
+
+
+def build_registry(size):
+    acl = Registry()
+    acl.add_role("member")
+    for i in range(size // 100):
+        acl.add_role("role-%d" % i, parents=["member"])
+        acl.add_resource("folder-%d" % i)
+        acl.allow("role-%d" % i, "view", "folder-%d" % i)
+    for i in range(size):
+        acl.add_resource("doc-%d" % i, parents=["folder-%d" % (i // 100)])
+    return acl
+
+
+def as_sets(acl):
+    """Convert the hierarchy into the previous layout, a set per node."""
+    for name in ("_roles", "_resources", "_operations"):
+        table = getattr(acl, name)
+        for key, parents in table.items():
+            table[key] = set(parents)
+    return acl
+
+
+def measure(factory, size):
+    gc.collect()
+    tracemalloc.start()
+    acl = factory(build_registry(size))
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del acl
+    return current
+
+
+def main():
+    for size in (10000, 100000, 1000000):
+        before = measure(as_sets, size)
+        after = measure(lambda acl: acl, size)
+        print("%8d resources: sets %8.1f MiB, tuples %8.1f MiB (%.0f%%)" % (
+            size, before / 2.0 ** 20, after / 2.0 ** 20,
+            100.0 * after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Load test the decision server, and report the latency and throughput."""
+
+from __future__ import print_function
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from rbac.acl import Registry
+from rbac.prebuilt import dump
+from rbac.server import DecisionClient
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_registry(size=200):
+    acl = Registry()
+    for i in range(size):
+        parents = ["role-%d" % (i // 2)] if i else []
+        acl.add_role("role-%d" % i, parents=parents)
+        acl.add_resource("res-%d" % i)
+        acl.allow("role-%d" % i, "view", "res-%d" % i)
+    return acl
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def load(path, concurrency, requests, pool_size):
+    client = DecisionClient(path=path, pool_size=pool_size)
+    latencies = []
+
+    async def worker(offset):
+        for i in range(offset, requests, concurrency):
+            started = time.perf_counter()
+            await client.is_any_allowed(
+                ["role-%d" % (i % 200)], "view", "res-%d" % (i % 37))
+            latencies.append(time.perf_counter() - started)
+
+    await client.is_any_allowed(["role-0"], "view", "res-0")  # warm up
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    client.close()
+    await client.wait_closed()
+    return sorted(latencies), elapsed
+
+
+def main(requests=20000):
+    directory = tempfile.mkdtemp()
+    registry_path = os.path.join(directory, "policy.rbac")
+    socket_path = os.path.join(directory, "rbac.sock")
+    with open(registry_path, "wb") as registry_file:
+        dump(build_registry(), registry_file)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "rbac.server", registry_path,
+         "--unix", socket_path], env=env)
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+        for concurrency, pool_size in [(1, 1), (16, 1), (64, 4), (256, 4)]:
+            loop = asyncio.new_event_loop()
+            latencies, elapsed = loop.run_until_complete(
+                load(socket_path, concurrency, requests, pool_size))
+            loop.close()
+            print("concurrency %3d pool %d: p50 %7.1f us, p99 %7.1f us, "
+                  "%8.0f checks/s" % (
+                      concurrency, pool_size,
+                      percentile(latencies, 0.5) * 1e6,
+                      percentile(latencies, 0.99) * 1e6,
+                      len(latencies) / elapsed))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""Compare the rule probing with and without the prefilter.
+
+The registry is sparse: deep hierarchies but few rules, so most of the
+probed (role, operation, resource) tuples match no rule. The evaluation
+plans are dropped before each check to measure the probing itself.
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from rbac.acl import Registry
+
+
+def build_registry(depth=12, width=20, rules=10):
+    acl = Registry()
+    for i in range(depth):
+        for j in range(width):
+            acl.add_role("r%d-%d" % (i, j), parents=(
+                [] if i == 0 else ["r%d-%d" % (i - 1, j),
+                                   "r%d-%d" % (i - 1, (j + 1) % width)]))
+            acl.add_resource("s%d-%d" % (i, j), parents=(
+                [] if i == 0 else ["s%d-%d" % (i - 1, j)]))
+    acl.add_operation("admin", parents=["edit"])
+    acl.add_operation("edit", parents=["view"])
+    for k in range(rules):
+        acl.allow("r%d-%d" % (k % depth, k), "view", "s0-%d" % k)
+    acl.deny("r3-3", "edit", "s1-3")
+    return acl
+
+
+def main(number=2000):
+    acl = build_registry()
+    checks = [("r11-%d" % j, "edit", "s11-%d" % j) for j in range(20)]
+
+    def check_all():
+        for check in checks:
+            acl._plans.clear()
+            acl.is_allowed(*check)
+
+    for prefilter in (False, True):
+        acl.prefilter_rules = prefilter
+        expected = [acl.is_allowed(*check) for check in checks]
+        elapsed = min(timeit.repeat(check_all, number=number // 20,
+                                    repeat=5))
+        print("prefilter %-5s %8.2f us/check (cold plan)" % (
+            prefilter, elapsed / (number // 20) / len(checks) * 1e6))
+        assert expected == [acl.is_allowed(*check) for check in checks]
+
+    elapsed = min(timeit.repeat(
+        lambda: acl.is_allowed(*checks[0]), number=number * 10, repeat=5))
+    print("cached plan     %8.2f us/check" % (elapsed / number / 10 * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Measure the time to the first is_allowed in a fresh interpreter."""
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from rbac.prebuilt import dump, write_module
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUILD = """
+from rbac.acl import Registry
+acl = Registry()
+for i in range(%(size)d):
+    parents = ["role-%%d" %% (i // 2)] if i else []
+    acl.add_role("role-%%d" %% i, parents=parents)
+    acl.add_resource("res-%%d" %% i)
+    acl.allow("role-%%d" %% i, "view", "res-%%d" %% i)
+"""
+
+SCENARIOS = [
+    ("import rbac", "import rbac"),
+    ("import rbac.acl", "import rbac.acl"),
+    ("build in code", BUILD + "acl.is_allowed('role-1', 'view', 'res-1')"),
+    ("load prebuilt file", (
+        "from rbac.prebuilt import load\n"
+        "with open(%(file)r, 'rb') as fp:\n"
+        "    acl = load(fp)\n"
+        "acl.is_allowed('role-1', 'view', 'res-1')")),
+    ("import prebuilt module", (
+        "import sys; sys.path.insert(0, %(dir)r)\n"
+        "from prebuilt_acl import registry\n"
+        "registry.is_allowed('role-1', 'view', 'res-1')")),
+]
+
+TIMER = """
+import time
+started = time.time()
+%s
+print(time.time() - started)
+"""
+
+
+def measure(code, repeat=5):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return min(float(subprocess.check_output(
+        [sys.executable, "-c", TIMER % code], env=env))
+        for _ in range(repeat))
+
+
+def main(size=10000):
+    namespace = {}
+    exec(BUILD % {"size": size}, namespace)
+    acl = namespace["acl"]
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "prebuilt.bin")
+    with open(path, "wb") as fp:
+        dump(acl, fp)
+    write_module(acl, os.path.join(directory, "prebuilt_acl.py"))
+
+    params = {"size": size, "file": path, "dir": directory}
+    for name, code in SCENARIOS:
+        print("%-24s %8.2f ms" % (name, measure(code % params) * 1e3))
+
+
+if __name__ == "__main__":
+    main()
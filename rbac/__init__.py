@@ -6,3 +6,20 @@ This is a simple role based access control utility in Python.
 """
 
 __all__ = ["acl", "context", "proxy"]
+
+# the submodules loaded lazily as attributes. Only the lightweight ones are
+# exported by ``from rbac import *``, since the others import heavier
+# modules, and some of them (server, loader) require Python 3.5+.
+_submodules = frozenset([
+    "acl", "compiler", "context", "diagnostics", "differential", "loader",
+    "materialized", "metrics", "overlay", "pattern", "prebuilt", "proxy",
+    "replay", "roleset", "server", "shard", "tenant"])
+
+
+def __getattr__(name):
+    # load the submodules lazily while they are used as attributes, such as
+    # ``import rbac; rbac.acl.Registry()`` (Python 3.7+)
+    if name in _submodules:
+        import importlib
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
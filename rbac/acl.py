@@ -1,75 +1,212 @@
 from __future__ import absolute_import
 
 import itertools
+import time
 
+try:
+    from _thread import allocate_lock
+except ImportError:  # Python 2
+    from thread import allocate_lock
 
-__all__ = ["Registry"]
+from .pattern import PathPattern, PatternIndex
+
+
+__all__ = ["Registry", "RegistrySnapshot", "RegistryDiff", "Assertion",
+           "AssertionTimeout"]
+
+
+#: the settings of registries, which could be set per instance, and are
+#: inherited by the overlays and snapshots.
+SETTINGS = ("cost_threshold", "plan_cache_size", "assertion_timeout",
+            "check_timeout", "assertion_workers", "timeout_result",
+            "assertion_hook", "prefilter_rules")
 
 
 class Registry(object):
     """The registry of access control list."""
 
+    #: the threshold of the worst-case number of probed rules of a check.
+    #: If it is set, a :class:`rbac.diagnostics.CostWarning` will be emitted
+    #: while a registration makes the worst case exceed it.
+    cost_threshold = None
+
+    #: the maximum number of cached evaluation plans.
+    plan_cache_size = 65536
+
+    #: the time budget of each assertion and of all assertions of a check,
+    #: in seconds. If any of them is set, the assertions of a check are
+    #: evaluated concurrently in a thread pool of `assertion_workers`
+    #: threads, and the check returns `timeout_result` if they overrun. The
+    #: overrunning assertions are not interrupted, but their results are
+    #: ignored. Each registry has its own pool, shared by its overlays, so
+    #: once `assertion_workers` assertions of it hang, its later assertions
+    #: wait behind them and time out too, but other registries are not
+    #: affected.
+    assertion_timeout = None
+    check_timeout = None
+    assertion_workers = 16
+    timeout_result = False
+
+    #: a callable object, which is called with ``(assertion, role,
+    #: operation, resource, elapsed, timed_out)`` after each assertion is
+    #: evaluated or timed out.
+    assertion_hook = None
+
+    #: skip the roles, operations and resources used by no rule before
+    #: probing the rules. It could be disabled for the dense registries.
+    prefilter_rules = True
+
     def __init__(self):
+        # the parents of roles, resources and operations are stored as
+        # tuples, and all the ones without parents share the empty tuple
         self._roles = {}
         self._resources = {}
         self._allowed = {}
         self._denied = {}
 
+        # the roles, operations and resources used by any allowed (denied)
+        # rule, to skip the probes which could not match a rule
+        self._allowed_index = (set(), set(), set())
+        self._denied_index = (set(), set(), set())
+
+        # the operations implied by each operation, and the reversed index
+        # with the precomputed families of checked operations
+        self._operations = {}
+        self._implying_operations = {}
+        self._operation_families = {}
+
+        # the resource patterns used in rules, matched by path
+        self._patterns = PatternIndex()
+
         # to allow additional short circuiting, track roles that only
         # ever deny access
         self._denial_only_roles = set()
         self._children = {}
 
+        # to skip roles which could not grant a special access, index the
+        # (operation, resource) pairs allowed by each role and its parents
+        self._grants = {}
+        self._family_grants = {}
+
+        # the evaluation plans of checked accesses, see `_get_plan`
+        self._plans = {}
+        self._plans_revision = 0
+
+        # the thread pool of time-bounded assertions, created on demand
+        self._assertion_executor = None
+
+        # the largest family sizes, tracked while `cost_threshold` is set
+        self._family_maxima = None
+
+        # increased by every change, to let the caches know they are stale
+        self._revision = 0
+
+        # the sum of fingerprints of all roles, resources and rules, which
+        # doesn't depend on the order of changes
+        self._content_digest = 0
+
     def add_role(self, role, parents=[]):
         """Add a role or append parents roles to a special role.
 
         All added roles should be hashable.
         (http://docs.python.org/glossary.html#term-hashable)
         """
-        self._roles.setdefault(role, set())
-        self._roles[role].update(parents)
+        self._revision += 1
+        is_new = role not in self._roles
+        self._digest_hierarchy("role", self._roles, role, parents)
+        self._roles[role] = append_parents(self._roles.get(role, ()), parents)
         for p in parents:
-            self._children.setdefault(p, set())
-            self._children[p].add(role)
-
-        # all roles start as deny-only (unless one of its parents
-        # isn't deny-only)
-        if not parents or self._roles_are_deny_only(parents):
+            self._children.setdefault(p, set()).add(role)
+
+        # new roles start as deny-only (unless some rule allows all roles),
+        # and a role gaining a parent which isn't deny-only isn't either,
+        # nor are its children
+        if not self._roles_are_deny_only(parents):
+            for r in get_family(self._children, role):
+                self._denial_only_roles.discard(r)
+        elif is_new and None not in self._grants:
             self._denial_only_roles.add(role)
 
+        # the parents changed, so the grants of the family are changed too
+        self._family_grants.clear()
+
+        if self.cost_threshold is not None:
+            self._check_cost("role", role)
+
     def add_resource(self, resource, parents=[]):
         """Add a resource or append parents resources to a special resource.
 
         All added resources should be hashable.
         (http://docs.python.org/glossary.html#term-hashable)
         """
-        self._resources.setdefault(resource, set())
-        self._resources[resource].update(parents)
+        self._revision += 1
+        self._digest_hierarchy("resource", self._resources, resource, parents)
+        self._resources[resource] = append_parents(
+            self._resources.get(resource, ()), parents)
+
+        if self.cost_threshold is not None:
+            self._check_cost("resource", resource)
+
+    def add_operation(self, operation, parents=[]):
+        """Add a operation or append the operations implied by it.
+
+        A operation implies its parents operations. For example, after
+        ``add_operation("admin", parents=["write"])``, a role allowed to
+        "admin" a resource is allowed to "write" it as well, and a role denied
+        to "write" a resource is denied to "admin" it as well.
+        """
+        self._revision += 1
+        self._digest_hierarchy("operation", self._operations, operation,
+                               parents)
+        self._operations[operation] = append_parents(
+            self._operations.get(operation, ()), parents)
+        for p in parents:
+            self._implying_operations.setdefault(p, set()).add(operation)
+        self._operation_families.clear()
+
+        if self.cost_threshold is not None:
+            self._check_cost("operation", operation)
 
     def allow(self, role, operation, resource, assertion=None):
         """Add a allowed rule.
 
         The added rule will allow the role and its all children roles to
-        operate the resource.
+        operate the resource. The resource could be a
+        :class:`rbac.pattern.PathPattern` to cover all matched resources.
         """
         assert not role or role in self._roles
-        assert not resource or resource in self._resources
+        assert not resource or self._is_rule_resource(resource)
+        self._revision += 1
+        self._digest_rule("allow", self._allowed, (role, operation, resource),
+                          assertion)
         self._allowed[role, operation, resource] = assertion
+        index_rule(self._allowed_index, (role, operation, resource))
+        self._add_pattern(resource)
+        self._grants.setdefault(role, set()).add((operation, resource))
+        self._family_grants.clear()
 
         # since we just allowed a permission, role and any children aren't
-        # denied-only
-        for r in itertools.chain([role], get_family(self._children, role)):
+        # denied-only, and the rule of None role applies to all roles
+        roles = list(self._roles) if role is None else itertools.chain(
+            [role], get_family(self._children, role))
+        for r in roles:
             self._denial_only_roles.discard(r)
 
     def deny(self, role, operation, resource, assertion=None):
         """Add a denied rule.
 
         The added rule will deny the role and its all children roles to
-        operate the resource.
+        operate the resource. The resource could be a
+        :class:`rbac.pattern.PathPattern` to cover all matched resources.
         """
         assert not role or role in self._roles
-        assert not resource or resource in self._resources
+        assert not resource or self._is_rule_resource(resource)
+        self._revision += 1
+        self._digest_rule("deny", self._denied, (role, operation, resource),
+                          assertion)
         self._denied[role, operation, resource] = assertion
+        index_rule(self._denied_index, (role, operation, resource))
+        self._add_pattern(resource)
 
     def is_allowed(self, role, operation, resource, check_allowed=True,
                    **assertion_kwargs):
@@ -79,59 +216,707 @@ class Registry(object):
         is allowed, this method will return True; if there is not any rule
         for the access, this method will return None.
         """
-        assert not role or role in self._roles
-        assert not resource or resource in self._resources
-
-        roles = set(get_family(self._roles, role))
-        operations = {None, operation}
-        resources = set(get_family(self._resources, resource))
-
-        def DefaultAssertion(*args, **kwargs):
-            return True
+        # `_find_plan` inlined, since it is the hottest path
+        if self._plans_revision != self._revision:
+            self._plans.clear()
+            self._plans_revision = self._revision
+        plan = self._plans.get((role, operation, resource))
+        if plan is None:
+            plan = self._get_plan(role, operation, resource)
+        if plan is False:
+            return False  # denied by rule immediately
+
+        denials, allowances = plan
+        if not check_allowed:
+            allowances = ()
+        if not denials:
+            if not allowances:
+                return None  # no matching rules
+            if allowances is True:
+                return True  # allowed by rule
+
+        # the assertion results of this evaluation
+        return self._check_assertions(denials, allowances, {}, role,
+                                      operation, resource, assertion_kwargs)
+
+    def _is_allowed_until(self, deadline, role, operation, resource,
+                          check_allowed, assertion_kwargs):
+        """Check the permission within the deadline of a check of roles."""
+        plan = self._find_plan(role, operation, resource)
+        if plan is False:
+            return False
+        denials, allowances = plan
+        if not check_allowed:
+            allowances = ()
+        if not denials and not allowances:
+            return None
+        return self._check_assertions(denials, allowances,
+                                      {_DEADLINE: deadline}, role, operation,
+                                      resource, assertion_kwargs)
+
+    def _find_plan(self, role, operation, resource):
+        if self._plans_revision != self._revision:
+            self._plans.clear()
+            self._plans_revision = self._revision
+        plan = self._plans.get((role, operation, resource))
+        if plan is None:
+            plan = self._get_plan(role, operation, resource)
+        return plan
+
+    def _check_assertions(self, denials, allowances, results, role,
+                          operation, resource, assertion_kwargs):
+        """Decide the access by the assertions of the matched rules."""
+        try:
+            if denials and self._any_assertion(
+                    denials, results, role, operation, resource,
+                    assertion_kwargs):
+                return False  # denied by rule
 
-        is_allowed = None
-        default_assertion = DefaultAssertion
+            if allowances is True:
+                return True  # allowed by rule
+            if allowances and self._any_assertion(
+                    allowances, results, role, operation, resource,
+                    assertion_kwargs):
+                return True  # allowed by rule
+        except AssertionTimeout:
+            return self.timeout_result
 
-        for permission in itertools.product(roles, operations, resources):
-            if permission in self._denied:
-                assertion = self._denied[permission] or default_assertion
-                if assertion(self, role, operation, resource,
-                             **assertion_kwargs):
-                    return False  # denied by rule immediately
+        return None
 
-            if check_allowed and permission in self._allowed:
-                assertion = self._allowed[permission] or default_assertion
-                if assertion(self, role, operation, resource,
-                             **assertion_kwargs):
-                    is_allowed = True  # allowed by rule
+    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
+        """Check the permission with many roles.
 
-        return is_allowed
+        The roles could be a list (or a tuple), or a iterator which will be
+        consumed lazily and stop being pulled once the access is denied.
+        """
+        if not isinstance(roles, (list, tuple)):
+            return self._is_any_allowed_lazily(roles, operation, resource,
+                                               **assertion_kwargs)
+
+        # the budget of check is shared by all roles
+        deadline = None
+        if self.check_timeout is not None:
+            deadline = timer() + self.check_timeout
+
+        candidates = self._get_candidate_grants(operation, resource)
+        grantable = [self._role_may_grant(role, candidates) for role in roles]
+        last_grantable = -1
+        for i, may_grant in enumerate(grantable):
+            if may_grant:
+                last_grantable = i
 
-    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
-        """Check the permission with many roles."""
         is_allowed = None  # no matching rules
         for i, role in enumerate(roles):
             # if access not yet allowed and all remaining roles could
-            # only deny access, short-circuit and return False
-            if not is_allowed and self._roles_are_deny_only(roles[i:]):
+            # not grant it, short-circuit and return False
+            if not is_allowed and i > last_grantable:
                 return False
 
-            check_allowed = not is_allowed
-
-            # if another role gave access,
+            # if another role gave access, or this role could not give it,
             # don't bother checking if this one is allowed
-            is_current_allowed = self.is_allowed(role, operation, resource,
-                                                 check_allowed=check_allowed,
-                                                 **assertion_kwargs)
+            check_allowed = not is_allowed and grantable[i]
+
+            if deadline is None:
+                is_current_allowed = self.is_allowed(
+                    role, operation, resource, check_allowed=check_allowed,
+                    **assertion_kwargs)
+            else:
+                is_current_allowed = self._is_allowed_until(
+                    deadline, role, operation, resource, check_allowed,
+                    assertion_kwargs)
             if is_current_allowed is False:
                 return False  # denied by rule
             elif is_current_allowed is True:
                 is_allowed = True
         return is_allowed
 
+    @property
+    def content_hash(self):
+        """The digest of all roles, resources, operations and rules.
+
+        The digest doesn't depend on the order of changes, and is stable
+        across processes while the roles, resources and operations have
+        stable `repr`. It is updated incrementally by each change.
+        """
+        return "%032x" % self._content_digest
+
+    def __eq__(self, other):
+        if not isinstance(other, Registry):
+            return NotImplemented
+        if self._content_digest != other._content_digest:
+            return False
+        return all(
+            copy_sets(getattr(self, name)) ==
+            copy_sets(getattr(other, name))
+            for name in ("_roles", "_resources", "_operations")) and \
+            dict(self._allowed) == dict(other._allowed) and \
+            dict(self._denied) == dict(other._denied)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def diff(self, other):
+        """Compare with another registry.
+
+        The returned :class:`RegistryDiff` contains the `added` items, which
+        are in the other registry only, and the `removed` items, which are in
+        this registry only. The items are tuples like ``("role", role)``,
+        ``("role-parent", role, parent)`` and
+        ``("allow", role, operation, resource, assertion_name)``.
+        """
+        if self._content_digest == other._content_digest:
+            return RegistryDiff(set(), set())
+        items = set(self._iter_content())
+        other_items = set(other._iter_content())
+        return RegistryDiff(other_items - items, items - other_items)
+
+    def analyze(self):
+        """Analyze the hierarchies of roles, resources and operations.
+
+        The returned :class:`rbac.diagnostics.HierarchyReport` reports the
+        family sizes, the worst-case cost of a check, the duplicate ancestor
+        paths and the cycles.
+        """
+        from .diagnostics import analyze
+        return analyze(self)
+
+    def snapshot(self):
+        """Get a read-only copy of the current state of this registry.
+
+        The snapshot is not affected by the later changes of this registry,
+        so it is a stable parent for overlays.
+        """
+        snapshot = RegistrySnapshot.__new__(RegistrySnapshot)
+        Registry.__init__(snapshot)
+        snapshot._roles = dict(self._roles)
+        snapshot._resources = dict(self._resources)
+        snapshot._allowed = dict(self._allowed)
+        snapshot._denied = dict(self._denied)
+        snapshot._operations = dict(self._operations)
+        snapshot._implying_operations = copy_sets(self._implying_operations)
+        snapshot._patterns = PatternIndex(self._patterns)
+        snapshot._denial_only_roles = set(
+            r for r in self._roles if r in self._denial_only_roles)
+        snapshot._children = copy_sets(self._children)
+        snapshot._grants = copy_sets(self._grants)
+        snapshot._index_rules()
+        snapshot._revision = self._revision
+        snapshot._content_digest = self._content_digest
+        for name in SETTINGS:
+            setattr(snapshot, name, getattr(self, name))
+        return snapshot
+
+    def overlay(self):
+        """Create a copy-on-write overlay of this registry.
+
+        The overlay is cheap to create, it records only its own changes and
+        leaves this registry untouched.
+        See :class:`rbac.overlay.OverlayRegistry`.
+        """
+        from .overlay import OverlayRegistry
+        return OverlayRegistry(self)
+
+    def _is_any_allowed_lazily(self, roles, operation, resource,
+                               **assertion_kwargs):
+        deadline = None
+        if self.check_timeout is not None:
+            deadline = timer() + self.check_timeout
+        candidates = self._get_candidate_grants(operation, resource)
+        is_allowed = None  # no matching rules
+        for role in roles:
+            # the remaining roles are unknown, so every role is checked for
+            # denial, but only the roles could grant the access are checked
+            # for allowance
+            check_allowed = (not is_allowed and
+                             self._role_may_grant(role, candidates))
+            if deadline is None:
+                is_current_allowed = self.is_allowed(
+                    role, operation, resource, check_allowed=check_allowed,
+                    **assertion_kwargs)
+            else:
+                is_current_allowed = self._is_allowed_until(
+                    deadline, role, operation, resource, check_allowed,
+                    assertion_kwargs)
+            if is_current_allowed is False:
+                return False  # denied by rule
+            elif is_current_allowed is True:
+                is_allowed = True
+        return is_allowed
+
+    def _any_assertion(self, assertions, results, role, operation, resource,
+                       assertion_kwargs):
+        """Check whether any assertion passes, in the order of the plan."""
+        if self.assertion_timeout is not None or \
+                self.check_timeout is not None:
+            return self._any_assertion_in_time(
+                assertions, results, role, operation, resource,
+                assertion_kwargs)
+        hook = self.assertion_hook
+        for assertion in assertions:
+            key = id(assertion)
+            if key not in results:
+                if hook is None:
+                    results[key] = assertion(self, role, operation, resource,
+                                             **assertion_kwargs)
+                else:
+                    results[key], elapsed = call_timed(
+                        assertion, self, role, operation, resource,
+                        assertion_kwargs)
+                    hook(assertion, role, operation, resource, elapsed,
+                         False)
+            if results[key]:
+                return True
+        return False
+
+    def _any_assertion_in_time(self, assertions, results, role, operation,
+                               resource, assertion_kwargs):
+        """Check whether any assertion passes within the time budgets.
+
+        The assertions are evaluated concurrently in a thread pool. If the
+        budgets are used up before any one passes and all the others fail,
+        :class:`AssertionTimeout` is raised.
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        started = timer()
+        limit = results.get(_DEADLINE)
+        if limit is None and self.check_timeout is not None:
+            limit = results[_DEADLINE] = started + self.check_timeout
+        if self.assertion_timeout is not None:
+            limit = min(limit or float("inf"),
+                        started + self.assertion_timeout)
+
+        pending = {}
+        executor = self._get_assertion_executor()
+        for assertion in assertions:
+            key = id(assertion)
+            if key in results:
+                if results[key]:
+                    return True
+            elif not any(a is assertion for a in pending.values()):
+                future = executor.submit(
+                    call_timed, assertion, self, role, operation, resource,
+                    assertion_kwargs)
+                pending[future] = assertion
+
+        hook = self.assertion_hook
+        try:
+            while pending:
+                done, _ = wait(list(pending), max(0, limit - timer()),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    if hook is not None:
+                        for assertion in pending.values():
+                            hook(assertion, role, operation, resource,
+                                 timer() - started, True)
+                    raise AssertionTimeout(
+                        "the assertions of %r are not finished in time" %
+                        ((role, operation, resource),))
+                for future in done:
+                    assertion = pending.pop(future)
+                    result, elapsed = future.result()
+                    results[id(assertion)] = result
+                    if hook is not None:
+                        hook(assertion, role, operation, resource, elapsed,
+                             False)
+                    if result:
+                        return True
+            return False
+        finally:
+            for future in pending:
+                future.cancel()  # only the ones not started are cancelled
+
+    def _get_assertion_executor(self):
+        """Get the thread pool of this registry, creating it on demand."""
+        if self._assertion_executor is None:
+            with _executor_lock:
+                if self._assertion_executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self._assertion_executor = ThreadPoolExecutor(
+                        self.assertion_workers)
+        return self._assertion_executor
+
     def _roles_are_deny_only(self, roles):
         return all(r in self._denial_only_roles for r in roles)
 
+    def _check_cost(self, kind, node):
+        from .diagnostics import check_cost
+        check_cost(self, kind, node)
+
+    def _iter_content(self):
+        """Iterate the items of which the content hash is made up."""
+        for kind, all_parents in [("role", self._roles),
+                                  ("resource", self._resources),
+                                  ("operation", self._operations)]:
+            for current, parents in all_parents.items():
+                yield (kind, current)
+                for parent in parents:
+                    yield (kind + "-parent", current, parent)
+        for kind, rules in [("allow", self._allowed), ("deny", self._denied)]:
+            for key, assertion in rules.items():
+                yield (kind,) + key + (assertion_name(assertion),)
+
+    def _digest_hierarchy(self, kind, all_parents, current, parents):
+        existing = all_parents.get(current)
+        if existing is None:
+            self._digest_item((kind, current))
+            existing = ()
+        for parent in set(parents):
+            if parent not in existing:
+                self._digest_item((kind + "-parent", current, parent))
+
+    def _digest_rule(self, kind, rules, key, assertion):
+        if key in rules:
+            self._digest_item((kind,) + key + (assertion_name(rules[key]),),
+                              sign=-1)
+        self._digest_item((kind,) + key + (assertion_name(assertion),))
+
+    def _digest_item(self, item, sign=1):
+        self._content_digest = (self._content_digest + sign *
+                                int(fingerprint(item), 16)) % (1 << 128)
+
+    def _clear_caches(self):
+        self._operation_families.clear()
+        self._family_grants.clear()
+        self._plans.clear()
+
+    def _get_plan(self, role, operation, resource):
+        """Get the evaluation plan of the access, and cache it.
+
+        The plan is False if an assertion-free denied rule matches. Otherwise
+        it is a pair of the denied assertions and the allowed assertions
+        (or True if an assertion-free allowed rule matches). The assertions
+        are ordered by their costs, and then the nearest ancestor first: the
+        role family, the resource family and the operation family are walked
+        breadth-first and in this priority.
+        """
+        assert not role or role in self._roles
+        resources = self._get_resource_family(resource)
+        assert not resource or resource in self._resources or \
+            any(isinstance(r, PathPattern) for r in resources)
+
+        roles = list(get_family_by_distance(self._roles, role))
+        granting, denying = self._get_operation_families(operation)
+
+        denials = []
+        for r, res, op in self._probe(self._denied_index, roles, resources,
+                                      denying):
+            if (r, op, res) in self._denied:
+                assertion = self._denied[r, op, res]
+                if assertion is None:
+                    denials = False
+                    break
+                denials.append(assertion)
+
+        allowances = []
+        if denials is not False:
+            for r, res, op in self._probe(self._allowed_index, roles,
+                                          resources, granting):
+                if (r, op, res) in self._allowed:
+                    assertion = self._allowed[r, op, res]
+                    if assertion is None:
+                        allowances = True
+                        break
+                    allowances.append(assertion)
+
+        if denials is False:
+            plan = False
+        else:
+            plan = (order_assertions(denials), allowances if allowances is
+                    True else order_assertions(allowances))
+        if len(self._plans) >= self.plan_cache_size:
+            self._plans.clear()
+        self._plans[role, operation, resource] = plan
+        return plan
+
+    def _is_rule_resource(self, resource):
+        return resource in self._resources or isinstance(resource, PathPattern)
+
+    def _add_pattern(self, resource):
+        if isinstance(resource, PathPattern):
+            self._patterns.add(resource)
+
+    def _get_operation_families(self, operation):
+        """Get the operations whose rules could allow or deny the operation.
+
+        The allowed rules of the operation and all operations implying it are
+        applied, and the denied rules of the operation and all operations
+        implied by it are applied.
+        """
+        families = self._operation_families.get(operation)
+        if families is None:
+            families = (
+                tuple(get_family_by_distance(
+                    self._implying_operations, operation)),
+                tuple(get_family_by_distance(self._operations, operation)))
+            self._operation_families[operation] = families
+        return families
+
+    def _get_resource_family(self, resource):
+        """Get the resource, its parents and the patterns matching them.
+
+        The resource and its parents are ordered nearest first, followed by
+        the matched patterns and None at last.
+        """
+        resources = list(get_family_by_distance(self._resources, resource))
+        if self._patterns:
+            matched = []
+            for r in resources:
+                for pattern in self._patterns.match(r):
+                    if pattern not in matched:
+                        matched.append(pattern)
+            resources[-1:-1] = matched
+        return resources
+
+    def _is_assertion_free(self, roles, operation, resource):
+        """Check whether no assertion is involved in checking the access."""
+        granting, denying = self._get_operation_families(operation)
+        operations = set(granting).union(denying)
+        resources = self._get_resource_family(resource)
+        for role in roles:
+            family = list(get_family(self._roles, role))
+            for rules, index in [(self._denied, self._denied_index),
+                                 (self._allowed, self._allowed_index)]:
+                for r, res, op in self._probe(index, family, resources,
+                                              operations):
+                    if rules.get((r, op, res)) is not None:
+                        return False
+        return True
+
+    def _index_rules(self):
+        """Build the index of rules again."""
+        self._allowed_index = (set(), set(), set())
+        self._denied_index = (set(), set(), set())
+        for key in self._allowed:
+            index_rule(self._allowed_index, key)
+        for key in self._denied:
+            index_rule(self._denied_index, key)
+
+    def _probe(self, index, roles, resources, operations):
+        """Iterate the (role, resource, operation) to probe the rules.
+
+        The roles, resources and operations used by no rule are skipped if
+        the prefilter is enabled, so the result is same but faster.
+        """
+        if self.prefilter_rules:
+            role_index, operation_index, resource_index = index
+            roles = [r for r in roles if r in role_index]
+            resources = [r for r in resources if r in resource_index]
+            operations = [o for o in operations if o in operation_index]
+        return itertools.product(roles, resources, operations)
+
+    def _get_candidate_grants(self, operation, resource):
+        """Get all (operation, resource) pairs which could grant the access."""
+        return frozenset(itertools.product(
+            self._get_operation_families(operation)[0],
+            self._get_resource_family(resource)))
+
+    def _role_may_grant(self, role, candidates):
+        """Check whether the role or its parents allow any of candidates."""
+        if role in self._denial_only_roles:
+            return False
+        grants = self._family_grants.get(role)
+        if grants is None:
+            grants = frozenset(itertools.chain.from_iterable(
+                self._grants.get(r, ())
+                for r in get_family(self._roles, role)))
+            self._family_grants[role] = grants
+        return not grants.isdisjoint(candidates)
+
+
+class RegistrySnapshot(Registry):
+    """A read-only copy of a registry, created by :meth:`Registry.snapshot`.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("the registry snapshot is read-only")
+
+    add_role = add_resource = add_operation = allow = deny = _read_only
+
+
+class RegistryDiff(tuple):
+    """The difference of two registries, created by :meth:`Registry.diff`.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, added, removed):
+        return super(RegistryDiff, cls).__new__(cls, (added, removed))
+
+    def __repr__(self):
+        return "RegistryDiff(added=%r, removed=%r)" % self
+
+    @property
+    def added(self):
+        return self[0]
+
+    @property
+    def removed(self):
+        return self[1]
+
+
+class Assertion(object):
+    """A assertion with the hints to schedule and cache it.
+
+    The `cost` of assertions decides the order of evaluation, the cheaper
+    one will be evaluated earlier and the expensive ones may be skipped. The
+    plain functions are considered as the cheapest ones.
+
+    The results of a `pure` assertion, which only depends on its arguments,
+    will be cached across evaluations of each registry. The assertion
+    keyword arguments should be hashable to be cached.
+
+    Example:
+    >>> def is_owner(acl, role, operation, resource, user_id):
+    ...     return redis.sismember("owners:%s" % resource, user_id)
+    >>> acl.allow("staff", "edit", "post", Assertion(is_owner, cost=10))
+    """
+
+    __slots__ = ("func", "cost", "pure", "maxsize", "_results")
+
+    def __init__(self, func, cost=0, pure=False, maxsize=1024):
+        self.func = func
+        self.cost = cost
+        self.pure = pure
+        self.maxsize = maxsize
+        self._results = {}
+
+    def __repr__(self):
+        return "Assertion(%r, cost=%r, pure=%r)" % (
+            self.func, self.cost, self.pure)
+
+    def __call__(self, acl, role, operation, resource, **assertion_kwargs):
+        if not self.pure:
+            return self.func(acl, role, operation, resource,
+                             **assertion_kwargs)
+
+        # the results are cached per registry, which is weakly referenced
+        # to tell it from a later registry reusing its id
+        try:
+            key = (id(acl), role, operation, resource,
+                   frozenset(assertion_kwargs.items()))
+            owner, result = self._results[key]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable arguments
+            return self.func(acl, role, operation, resource,
+                             **assertion_kwargs)
+        else:
+            if owner() is acl:
+                return result
+
+        result = self.func(acl, role, operation, resource, **assertion_kwargs)
+        from weakref import ref  # imported lazily to reduce the startup time
+        try:
+            owner = ref(acl)
+        except TypeError:  # not a registry
+            return result
+        if len(self._results) >= self.maxsize:
+            self._results.clear()
+        self._results[key] = (owner, result)
+        return result
+
+    def clear(self):
+        """Drop the cached results."""
+        self._results.clear()
+
+
+def append_parents(existing, parents):
+    """Append the new parents to the tuple of existing parents."""
+    added = []
+    for parent in parents:
+        if parent not in existing and parent not in added:
+            added.append(parent)
+    return existing + tuple(added) if added else existing
+
+
+class AssertionTimeout(Exception):
+    """The assertions of a check are not finished within the budgets."""
+
+
+timer = getattr(time, "perf_counter", time.time)
+
+# the key of the deadline of a check in the assertion results
+_DEADLINE = "deadline"
+
+# only for creating the thread pools of registries
+_executor_lock = allocate_lock()
+
+
+def call_timed(assertion, acl, role, operation, resource, assertion_kwargs):
+    """Call the assertion, and return the result and the elapsed time."""
+    started = timer()
+    result = assertion(acl, role, operation, resource, **assertion_kwargs)
+    return result, timer() - started
+
+
+def index_rule(index, key):
+    """Add the role, operation and resource of a rule into the index."""
+    for items, item in zip(index, key):
+        items.add(item)
+
+
+def copy_sets(all_sets):
+    return dict((key, set(value)) for key, value in all_sets.items())
+
+
+def fingerprint(obj):
+    """Get a digest of the object which is stable across processes."""
+    import hashlib  # imported lazily to reduce the startup time
+    return hashlib.md5(repr(obj).encode("utf-8")).hexdigest()
+
+
+def assertion_name(assertion):
+    """Get a stable name of the assertion, used by the content hash."""
+    if assertion is None:
+        return None
+    cost = get_assertion_cost(assertion)
+    func = getattr(assertion, "func", assertion)
+    name = getattr(func, "__qualname__", getattr(func, "__name__", None))
+    if name is None:
+        name = type(func).__name__
+    return "%s.%s/%r" % (getattr(func, "__module__", ""), name, cost)
+
+
+def get_assertion_cost(assertion):
+    return getattr(assertion, "cost", 0)
+
+
+def order_assertions(assertions):
+    """Deduplicate the assertions and order them by their costs stably."""
+    unique = []
+    seen = set()
+    for assertion in assertions:
+        if id(assertion) not in seen:
+            seen.add(id(assertion))
+            unique.append(assertion)
+    return tuple(sorted(unique, key=get_assertion_cost))
+
+
+def get_family_by_distance(all_parents, current):
+    """Iterate current object and its all parents breadth-first.
+
+    Every object is yielded once, the nearer one first, and None is
+    yielded at last.
+    """
+    seen = set([current, None])
+    level = [current]
+    if current is not None:
+        yield current
+    while level:
+        next_level = []
+        for node in level:
+            for parent in all_parents.get(node, ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    next_level.append(parent)
+                    yield parent
+        level = next_level
+    yield None
+
 
 def get_family(all_parents, current):
     """Iterate current object and its all parents recursively."""
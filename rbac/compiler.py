@@ -0,0 +1,336 @@
+from __future__ import absolute_import
+
+import itertools
+import marshal
+import os
+import sys
+import tempfile
+
+from .acl import (_DEADLINE, fingerprint, get_assertion_cost, get_family,
+                  timer)
+
+
+__all__ = ["compile_registry", "CompiledPolicy"]
+
+_MISSING = object()
+
+
+def compile_registry(acl, cache_dir=None):
+    """Compile a registry into a specialized decision function.
+
+    The roles, operations and resources are interned as integers, and a
+    Python function over precomputed dispatch tables is generated. The
+    assertions are kept as opaque calls.
+
+    If `cache_dir` is given, the compiled code will be stored there, keyed
+    by the content hash of the registry, and reused while compiling the same
+    registry again, even in another process.
+    """
+    return CompiledPolicy(acl, cache_dir)
+
+
+class CompiledPolicy(object):
+    """A compiled registry, created by :func:`compile_registry`.
+
+    The policy is a snapshot of the registry while it is compiled, which is
+    not updated with the later changes. The resources only matched by
+    patterns and the unknown roles are delegated to the registry.
+    """
+
+    def __init__(self, acl, cache_dir=None):
+        self.acl = acl
+        self.revision = acl._revision
+
+        interned = _Interned(acl)
+        self.content_hash = interned.content_hash
+        self._role_ids = interned.role_ids
+        self._operation_ids = interned.operation_ids
+        self._resource_ids = interned.resource_ids
+        self._assertions = interned.assertions
+        self._costs = [get_assertion_cost(a) for a in interned.assertions]
+
+        code = None
+        cache_path = None
+        if cache_dir is not None and interned.is_canonical:
+            cache_path = os.path.join(cache_dir, "rbac-%s-py%d%d.marshal" % (
+                (self.content_hash,) + tuple(sys.version_info[:2])))
+            code = _load_code(cache_path)
+        self.from_cache = code is not None
+        if code is None:
+            self.source = generate_source(interned)
+            code = compile(self.source, "<rbac-policy-%s>" % self.content_hash,
+                           "exec")
+            if cache_path is not None:
+                _dump_code(cache_path, code)
+
+        namespace = {}
+        exec(code, namespace)
+        self._decide = namespace["decide"]
+        self._decisions = {}
+        self._denial_decisions = {}  # without checking the allowed rules
+
+    @property
+    def is_stale(self):
+        """Whether the registry has been changed after compiling."""
+        return self.acl._revision != self.revision
+
+    def is_allowed(self, role, operation, resource, check_allowed=True,
+                   **assertion_kwargs):
+        """Check the permission like :meth:`rbac.acl.Registry.is_allowed`.
+
+        The decisions are memoized per access, so a repeated check costs a
+        single lookup.
+        """
+        decisions = self._decisions if check_allowed else \
+            self._denial_decisions
+        try:
+            decision = decisions[role, operation, resource]
+        except KeyError:
+            return self._is_allowed_until(None, role, operation, resource,
+                                          check_allowed, assertion_kwargs)
+        if type(decision) is not tuple:
+            return decision
+
+        # allowances is True if there is a assertion-free allowed rule
+        denials, allowances = decision
+        return self.acl._check_assertions(denials, allowances, {}, role,
+                                          operation, resource,
+                                          assertion_kwargs)
+
+    def _is_allowed_until(self, deadline, role, operation, resource,
+                          check_allowed, assertion_kwargs):
+        """Check the permission within the deadline of a check of roles.
+
+        The deadline is None if there is no budget of check.
+        """
+        decisions = self._decisions if check_allowed else \
+            self._denial_decisions
+        decision = decisions.get((role, operation, resource), _MISSING)
+        if decision is _MISSING:
+            role_id = self._role_ids.get(role)
+            resource_id = self._resource_ids.get(resource)
+            if role_id is None or resource_id is None:
+                if deadline is None:
+                    return self.acl.is_allowed(role, operation, resource,
+                                               check_allowed=check_allowed,
+                                               **assertion_kwargs)
+                return self.acl._is_allowed_until(
+                    deadline, role, operation, resource, check_allowed,
+                    assertion_kwargs)
+            decision = self._memoize(role, operation, resource,
+                                     check_allowed, role_id, resource_id)
+        if type(decision) is not tuple:
+            return decision
+
+        denials, allowances = decision
+        results = {} if deadline is None else {_DEADLINE: deadline}
+        return self.acl._check_assertions(denials, allowances, results, role,
+                                          operation, resource,
+                                          assertion_kwargs)
+
+    def _memoize(self, role, operation, resource, check_allowed, role_id,
+                 resource_id):
+        """Decide a access, and memoize the decision or the assertions.
+
+        The decision is a tuple of the assertions ordered by cost, if it
+        depends on them.
+        """
+        decision, denials, allowances = self._decide(
+            role_id, self._operation_ids.get(operation, 0), resource_id,
+            check_allowed)
+        if decision is None and (denials or allowances):
+            decision = (self._order(denials), allowances
+                        if allowances is True else self._order(allowances))
+        decisions = self._decisions if check_allowed else \
+            self._denial_decisions
+        if len(decisions) >= self.acl.plan_cache_size:
+            decisions.clear()
+        decisions[role, operation, resource] = decision
+        return decision
+
+    def _order(self, indexes):
+        return tuple(self._assertions[index] for index in
+                     sorted(set(indexes), key=self._costs.__getitem__))
+
+    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
+        """Check the permission with many roles.
+
+        Like :meth:`is_allowed`, the result is True, False or None, but it
+        may be None where the registry returns False and vice versa.
+        """
+        # the budget of check is shared by all roles
+        deadline = None
+        if self.acl.check_timeout is not None:
+            deadline = timer() + self.acl.check_timeout
+
+        is_allowed = None
+        for role in roles:
+            if deadline is None:
+                is_current_allowed = self.is_allowed(
+                    role, operation, resource, check_allowed=not is_allowed,
+                    **assertion_kwargs)
+            else:
+                is_current_allowed = self._is_allowed_until(
+                    deadline, role, operation, resource, not is_allowed,
+                    assertion_kwargs)
+            if is_current_allowed is False:
+                return False
+            elif is_current_allowed is True:
+                is_allowed = True
+        return is_allowed
+
+
+class _Interned(object):
+    """The registry with the interned roles, operations and resources.
+
+    The integer identities are assigned in a canonical order, decided by the
+    fingerprints of objects, so the same registry gets the same identities
+    in different processes. The identity of None is always 0.
+    """
+
+    def __init__(self, acl):
+        rule_keys = list(itertools.chain(acl._allowed, acl._denied))
+
+        roles = set(acl._roles)
+        operations = set(acl._operations)
+        operations.update(*acl._operations.values())
+        resources = set(acl._resources)
+        resources.update(acl._patterns)
+        for role, operation, resource in rule_keys:
+            roles.add(role)
+            operations.add(operation)
+            resources.add(resource)
+
+        self.is_canonical = True
+        self.role_ids = self._intern(roles)
+        self.operation_ids = self._intern(operations)
+        self.resource_ids = self._intern(resources)
+
+        self.role_families = self._families(
+            self.role_ids, lambda r: get_family(acl._roles, r))
+        self.resource_families = self._families(
+            self.resource_ids, acl._get_resource_family)
+        self.granting_families = self._families(
+            self.operation_ids, lambda o: acl._get_operation_families(o)[0])
+        self.denying_families = self._families(
+            self.operation_ids, lambda o: acl._get_operation_families(o)[1])
+
+        # each rule with assertion gets its own index, in canonical order
+        self.assertions = []
+        self.allowed = self._rules(acl._allowed)
+        self.denied = self._rules(acl._denied)
+
+        self.content_hash = acl.content_hash
+
+    def _intern(self, objects):
+        objects.discard(None)
+        fingerprints = dict((obj, fingerprint(obj)) for obj in objects)
+        if len(set(fingerprints.values())) != len(fingerprints):
+            self.is_canonical = False  # different objects with same repr
+        ordered = sorted(objects, key=fingerprints.__getitem__)
+        ids = dict((obj, i) for i, obj in enumerate(ordered, 1))
+        ids[None] = 0
+        return ids
+
+    def _families(self, ids, get_family):
+        families = [None] * len(ids)
+        for obj, i in ids.items():
+            families[i] = tuple(sorted(set(
+                ids[member] for member in get_family(obj) if member in ids)))
+        return families
+
+    def _rules(self, rules):
+        interned = {}
+        for key in sorted(rules, key=fingerprint):
+            role, operation, resource = key
+            assertion = rules[key]
+            if assertion is None:
+                index = -1
+            else:
+                index = len(self.assertions)
+                self.assertions.append(assertion)
+            interned[self.role_ids[role], self.operation_ids[operation],
+                     self.resource_ids[resource]] = index
+        return interned
+
+
+def generate_source(interned):
+    """Generate the source of a decision function from a interned registry.
+    """
+    stride = len(interned.resource_ids)
+
+    def flatten(rules):
+        # merge the rules of each role's family, keyed by a single integer
+        # of the operation and the resource
+        tables = []
+        for family in interned.role_families:
+            table = {}
+            for (role, operation, resource), index in sorted(rules.items()):
+                if role in family:
+                    key = operation * stride + resource
+                    table[key] = tuple(sorted(table.get(key, ()) + (index,)))
+            tables.append(table)
+        return tables
+
+    lines = [
+        "# generated by rbac.compiler from registry %s"
+        % interned.content_hash,
+        "",
+        "STRIDE = %d" % stride,
+        "RESOURCES = %r" % (tuple(interned.resource_families),),
+        "GRANTING = %r" % (tuple(interned.granting_families),),
+        "DENYING = %r" % (tuple(interned.denying_families),),
+        "ALLOWED = %r" % (tuple(flatten(interned.allowed)),),
+        "DENIED = %r" % (tuple(flatten(interned.denied)),),
+        "",
+        "",
+        "def decide(role, operation, resource, check_allowed):",
+        "    resources = RESOURCES[resource]",
+        "    denials = []",
+        "    denied = DENIED[role]",
+        "    if denied:",
+        "        for o in DENYING[operation]:",
+        "            base = o * STRIDE",
+        "            for r in resources:",
+        "                hit = denied.get(base + r)",
+        "                if hit is not None:",
+        "                    if hit[0] < 0:",
+        "                        return False, None, None",
+        "                    denials.extend(hit)",
+        "    allowances = []",
+        "    allowed = ALLOWED[role]",
+        "    if check_allowed and allowed:",
+        "        for o in GRANTING[operation]:",
+        "            base = o * STRIDE",
+        "            for r in resources:",
+        "                hit = allowed.get(base + r)",
+        "                if hit is not None:",
+        "                    if hit[0] < 0:",
+        "                        if not denials:",
+        "                            return True, None, None",
+        "                        return None, denials, True",
+        "                    allowances.extend(hit)",
+        "    return None, denials, allowances",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def _load_code(path):
+    try:
+        with open(path, "rb") as cache_file:
+            return marshal.load(cache_file)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _dump_code(path, code):
+    # write to a temporary file at first, to avoid the partial cache files
+    directory = os.path.dirname(path)
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as cache_file:
+            marshal.dump(code, cache_file)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        pass
@@ -3,7 +3,7 @@ from __future__ import absolute_import
 import functools
 
 
-__all__ = ["IdentityContext", "PermissionDenied"]
+__all__ = ["IdentityContext", "PermissionGuard", "PermissionDenied"]
 
 
 class PermissionContext(object):
@@ -41,11 +41,61 @@ class PermissionContext(object):
         return True
 
 
+class PermissionGuard(object):
+    """A precompiled permission check to protect functions.
+
+    Different from :class:`PermissionContext`, the guard is created once and
+    holds no state of a calling, so it is cheaper to be called and is safe to
+    be shared by threads and asyncio tasks.
+    """
+
+    def __init__(self, checker, operation, resource, assertion_kwargs=None,
+                 exception=None, **exception_kwargs):
+        self._check = checker
+        self.operation = operation
+        self.resource = resource
+        self.assertion_kwargs = assertion_kwargs or {}
+        self.exception = exception or PermissionDenied
+        self.exception_kwargs = exception_kwargs
+
+    def __call__(self, wrapped):
+        checker = self._check
+        operation = self.operation
+        resource = self.resource
+        assertion_kwargs = self.assertion_kwargs
+        exception = self.exception
+        exception_kwargs = self.exception_kwargs
+
+        def wrapper(*args, **kwargs):
+            if not checker(operation, resource, **assertion_kwargs):
+                raise exception(**exception_kwargs)
+            return wrapped(*args, **kwargs)
+        return functools.update_wrapper(wrapper, wrapped)
+
+    def __bool__(self):
+        return bool(self._check(self.operation, self.resource,
+                                **self.assertion_kwargs))
+
+    def __nonzero__(self):
+        return self.__bool__()
+
+    def check(self):
+        if not self._check(self.operation, self.resource,
+                           **self.assertion_kwargs):
+            raise self.exception(**self.exception_kwargs)
+        return True
+
+
 class IdentityContext(object):
-    """A context of identity, providing the enviroment to control access."""
+    """A context of identity, providing the enviroment to control access.
+
+    If a :class:`rbac.roleset.RoleSetCache` is given as `role_sets`, the
+    loaded roles will be interned and the results will be cached per role set.
+    """
 
-    def __init__(self, acl, roles_loader=None):
+    def __init__(self, acl, roles_loader=None, role_sets=None):
         self.acl = acl
+        self.role_sets = role_sets
         self.set_roles_loader(roles_loader)
 
     def set_roles_loader(self, role_loader):
@@ -80,6 +130,23 @@ class IdentityContext(object):
                                     **assertion_kwargs or {})
         return PermissionContext(checker, exception, **exception_kwargs)
 
+    def permission_guard(self, operation, resource,
+                         assertion_kwargs=None, **exception_kwargs):
+        """A precompiled guard to check the permission.
+
+        The arguments are the same as :meth:`check_permission`. The return
+        value could be used as a decorator, a check function or a boolean-like
+        value, and it is better to be created once and reused.
+
+        Example:
+        >>> @context.permission_guard("view", "article", message="can't view")
+        ... def article_page():
+        ...     return "your-article"
+        """
+        exception = exception_kwargs.pop("exception", PermissionDenied)
+        return PermissionGuard(self._docheck, operation, resource,
+                               assertion_kwargs, exception, **exception_kwargs)
+
     def has_permission(self, *args, **kwargs):
         return bool(self.check_permission(*args, **kwargs))
 
@@ -89,13 +156,30 @@ class IdentityContext(object):
                    for role_group in role_groups)
 
     def _docheck(self, operation, resource, **assertion_kwargs):
+        if self.role_sets is not None:
+            # the role set is validated once while it is interned
+            role_set = self.role_sets.intern(self.load_roles())
+            return self.role_sets.is_any_allowed(role_set, operation, resource,
+                                                 **assertion_kwargs)
         had_roles = self.load_roles()
-        role_list = list(had_roles)
-        assert len(role_list) == len(set(role_list))  # duplicate role check
-        return self.acl.is_any_allowed(role_list, operation, resource,
+        if isinstance(had_roles, (list, tuple)):
+            assert len(had_roles) == len(set(had_roles))  # duplicate check
+        else:
+            # the roles will be pulled lazily until the access is denied
+            had_roles = iter_unique_roles(had_roles)
+        return self.acl.is_any_allowed(had_roles, operation, resource,
                                        **assertion_kwargs)
 
 
+def iter_unique_roles(roles):
+    """Iterate the roles and check the duplicate role incrementally."""
+    seen = set()
+    for role in roles:
+        assert role not in seen  # duplicate role check
+        seen.add(role)
+        yield role
+
+
 class PermissionDenied(Exception):
     """The exception for denied access request."""
 
@@ -0,0 +1,191 @@
+from __future__ import absolute_import
+
+import collections
+import warnings
+
+
+__all__ = ["analyze", "HierarchyReport", "FamilyStats", "CostWarning"]
+
+
+class CostWarning(UserWarning):
+    """The warning for a registration exceeding the cost threshold."""
+
+
+#: the statistics of a role, resource or operation. The `size` is the number
+#: of its distinct ancestors (itself and None included), and the `paths` is
+#: the number of ancestors visited by walking the hierarchy, which is larger
+#: than `size` while some ancestors are reachable by many paths. Both are
+#: None if it is in a cycle.
+FamilyStats = collections.namedtuple("FamilyStats", ["size", "paths"])
+
+
+class HierarchyReport(object):
+    """The analysis of a registry, created by :func:`analyze`."""
+
+    def __init__(self, roles, resources, operations, cycles):
+        self.roles = roles
+        self.resources = resources
+        self.operations = operations
+        self.cycles = cycles
+
+    def __repr__(self):
+        return ("<HierarchyReport roles=%d resources=%d operations=%d "
+                "cycles=%d worst_case=%r>" % (
+                    len(self.roles), len(self.resources),
+                    len(self.operations), len(self.cycles), self.worst_case))
+
+    @property
+    def worst_case(self):
+        """The worst-case number of probed rules of a check.
+
+        It is the product of the largest role family, the largest operation
+        family (counted twice, for allowed and denied rules) and the largest
+        resource family. It is None while there are cycles.
+        """
+        if self.cycles:
+            return None
+        return (max_size(self.roles) * 2 * max_size(self.operations) *
+                max_size(self.resources))
+
+    @property
+    def duplicate_paths(self):
+        """The nodes whose ancestors are reachable by many paths.
+
+        The values are the number of redundant visits while walking them.
+        """
+        return dict(
+            (node, stats.paths - stats.size)
+            for table in (self.roles, self.resources, self.operations)
+            for node, stats in table.items()
+            if stats.size is not None and stats.paths > stats.size)
+
+
+def analyze(acl):
+    """Analyze the hierarchies of roles, resources and operations."""
+    cycles = []
+    tables = []
+    for all_parents in (acl._roles, acl._resources, acl._operations):
+        stats, found_cycles = analyze_hierarchy(all_parents)
+        tables.append(stats)
+        cycles.extend(found_cycles)
+    return HierarchyReport(tables[0], tables[1], tables[2], cycles)
+
+
+def analyze_hierarchy(all_parents, roots=None):
+    """Get the family statistics and the cycles of a hierarchy.
+
+    Only the `roots` and their ancestors are walked if `roots` is given.
+    """
+    ancestors = {}
+    paths = {}
+    cycles = []
+    in_cycle = set()
+
+    for root in all_parents if roots is None else roots:
+        if root in ancestors or root in in_cycle:
+            continue
+        # walk the hierarchy in depth-first order without recursion
+        stack = [(root, iter(all_parents.get(root, ())))]
+        on_stack = [root]
+        while stack:
+            node, parents = stack[-1]
+            for parent in parents:
+                if parent in on_stack:
+                    cycle = tuple(on_stack[on_stack.index(parent):])
+                    cycles.append(cycle)
+                    in_cycle.update(cycle)
+                elif parent not in ancestors and parent not in in_cycle:
+                    stack.append((parent, iter(all_parents.get(parent, ()))))
+                    on_stack.append(parent)
+                    break
+            else:
+                stack.pop()
+                on_stack.pop()
+                parent_list = all_parents.get(node, ())
+                if node in in_cycle or any(p in in_cycle for p in parent_list):
+                    in_cycle.add(node)
+                    continue
+                family = set([node])
+                count = 1
+                for parent in parent_list:
+                    family.update(ancestors[parent])
+                    count += paths[parent]
+                ancestors[node] = family
+                paths[node] = count
+
+    # None is a member of each family too
+    stats = dict((node, FamilyStats(len(family) + 1, paths[node] + 1))
+                 for node, family in ancestors.items())
+    stats.update((node, FamilyStats(None, None)) for node in in_cycle)
+    return stats, cycles
+
+
+def max_size(stats):
+    return max([s.size for s in stats.values() if s.size] or [2])
+
+
+def check_cost(acl, kind, node):
+    """Emit a :class:`CostWarning` if the worst case exceeds the threshold.
+
+    The largest families are tracked incrementally, only the families of
+    the changed node and its descendants are walked.
+    """
+    maxima = acl._family_maxima
+    if maxima is None:
+        maxima = acl._family_maxima = FamilyMaxima(acl)
+    else:
+        all_parents = {"role": acl._roles, "resource": acl._resources,
+                       "operation": acl._operations}[kind]
+        all_children = {"role": acl._children,
+                        "resource": maxima.resource_children,
+                        "operation": acl._implying_operations}[kind]
+        if kind == "resource":
+            for parent in acl._resources[node]:
+                all_children.setdefault(parent, set()).add(node)
+        nodes = list(get_descendants(all_children, node))
+        stats, cycles = analyze_hierarchy(all_parents, nodes)
+        if cycles:
+            warnings.warn(CostWarning("the %s %r is in a cycle: %r" % (
+                kind, node, cycles[0])), stacklevel=4)
+            return
+        maxima.sizes[kind] = max(
+            [maxima.sizes[kind]] + [stats[n].size for n in nodes])
+
+    sizes = maxima.sizes
+    worst_case = (sizes["role"] * 2 * sizes["operation"] *
+                  sizes["resource"])
+    if worst_case > acl.cost_threshold:
+        warnings.warn(CostWarning(
+            "adding the %s %r makes the worst-case cost of a check %d, "
+            "exceeding the threshold %d" % (
+                kind, node, worst_case, acl.cost_threshold)), stacklevel=4)
+
+
+class FamilyMaxima(object):
+    """The largest family sizes of a registry, tracked by :func:`check_cost`.
+
+    The registry has no index of child resources, so it is kept here.
+    """
+
+    def __init__(self, acl):
+        report = analyze(acl)
+        self.sizes = {"role": max_size(report.roles),
+                      "resource": max_size(report.resources),
+                      "operation": max_size(report.operations)}
+        self.resource_children = {}
+        for resource, parents in acl._resources.items():
+            for parent in parents:
+                self.resource_children.setdefault(parent, set()).add(
+                    resource)
+
+
+def get_descendants(all_children, current):
+    """Iterate current object and its all descendants, each once."""
+    seen = set([current])
+    queue = [current]
+    for node in queue:
+        yield node
+        for child in all_children.get(node, ()):
+            if child not in seen:
+                seen.add(child)
+                queue.append(child)
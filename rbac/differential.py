@@ -0,0 +1,534 @@
+"""The randomized differential testing of the evaluation engines.
+
+Random registries are generated from seeds, and every engine (the
+registry, its caches, the compiled policy, the overlays, the prebuilt
+copies and so on) is checked against a straightforward reference
+evaluator of the semantics. A mismatch is shrunk to a minimal registry
+which still reproduces it. The time spent by each engine is reported, so a
+faster engine is validated together with its speedup::
+
+    python -m rbac.differential --seeds 500
+"""
+
+from __future__ import absolute_import, print_function
+
+import itertools
+import random
+import timeit
+
+from .acl import Assertion, Registry
+from .pattern import PathPattern
+
+
+__all__ = ["RegistrySpec", "Counterexample", "DifferentialReport",
+           "ENGINES", "generate_spec", "reference_is_allowed",
+           "reference_is_any_allowed", "evaluate_reference", "find_mismatch",
+           "shrink", "run"]
+
+
+def assert_true(acl, role, operation, resource, **assertion_kwargs):
+    return True
+
+
+def assert_false(acl, role, operation, resource, **assertion_kwargs):
+    return False
+
+
+def assert_flag(acl, role, operation, resource, flag=False):
+    return flag
+
+
+#: the assertions used by the generated rules, by names.
+ASSERTIONS = {"true": assert_true, "false": assert_false, "flag": assert_flag}
+
+
+class RegistrySpec(object):
+    """The description of a registry, which could be built and shrunk.
+
+    The `roles`, `resources` and `operations` are lists of ``(name,
+    parents)``, and the `rules` are lists of ``(kind, role, operation,
+    resource, assertion)``, where the kind is "allow" or "deny", the
+    resource may be a pattern string starting with "~", and the assertion is
+    None or a tuple of the name in :data:`ASSERTIONS`, the cost and whether
+    it is pure.
+    """
+
+    def __init__(self, roles, resources, operations, rules):
+        self.roles = roles
+        self.resources = resources
+        self.operations = operations
+        self.rules = rules
+
+    def build(self, acl=None, steps=None):
+        """Apply the spec to a registry, or the first `steps` changes."""
+        acl = Registry() if acl is None else acl
+        for step in itertools.islice(self.iter_steps(), steps):
+            method, args = step
+            getattr(acl, method)(*args)
+        return acl
+
+    def iter_steps(self):
+        for name, parents in self.roles:
+            yield "add_role", (name, parents)
+        for name, parents in self.resources:
+            yield "add_resource", (name, parents)
+        for name, parents in self.operations:
+            yield "add_operation", (name, parents)
+        for kind, role, operation, resource, assertion in self.rules:
+            yield kind, (role, operation, to_resource(resource),
+                         to_assertion(assertion))
+
+    def effective_rules(self):
+        """Get the rules in effect, the last one of each key.
+
+        The registry keeps one rule per ``(kind, role, operation,
+        resource)``, so a later rule replaces the earlier one of the key.
+        """
+        rules = {}
+        for rule in self.rules:
+            rules[rule[:4]] = rule
+        return [rule for rule in self.rules if rules[rule[:4]] is rule]
+
+    def count_steps(self):
+        return (len(self.roles) + len(self.resources) +
+                len(self.operations) + len(self.rules))
+
+    def format(self):
+        """Format the spec as the Python code to build it."""
+        lines = ["acl = Registry()"]
+        for method, args in self.iter_steps():
+            lines.append("acl.%s(%s)" % (method, ", ".join(
+                _format_argument(arg) for arg in args)))
+        return "\n".join(lines)
+
+    def without(self, kind, index):
+        """Get a copy of the spec without an item and the references to it.
+        """
+        items = dict(roles=self.roles, resources=self.resources,
+                     operations=self.operations, rules=self.rules)
+        removed = items[kind][index]
+        items[kind] = items[kind][:index] + items[kind][index + 1:]
+        if kind == "rules":
+            return RegistrySpec(**items)
+
+        # drop the references to the removed role, resource or operation
+        name = removed[0]
+        items[kind] = [(n, [p for p in parents if p != name])
+                       for n, parents in items[kind]]
+        position = {"roles": 1, "operations": 2, "resources": 3}[kind]
+        items["rules"] = [rule for rule in items["rules"]
+                          if rule[position] != name]
+        return RegistrySpec(**items)
+
+
+class Counterexample(object):
+    """A query of which the result of a engine is not the expected one."""
+
+    def __init__(self, engine, spec, method, query, expected, result):
+        self.engine = engine
+        self.spec = spec
+        self.method = method
+        self.query = query
+        self.expected = expected
+        self.result = result
+
+    def format(self):
+        roles, operation, resource, assertion_kwargs = self.query
+        return "%s\n# %s: %s(%r, %r, %r, **%r) should be %r, got %r" % (
+            self.spec.format(), self.engine, self.method, roles, operation,
+            resource, assertion_kwargs, self.expected, self.result)
+
+
+class DifferentialReport(object):
+    """The results of :func:`run`."""
+
+    def __init__(self):
+        self.seeds = 0
+        self.checks = 0
+        self.timings = {}  # engine -> seconds
+        self.counterexamples = []
+
+    def format(self):
+        lines = ["%d registries, %d checks, %d counterexamples" % (
+            self.seeds, self.checks, len(self.counterexamples))]
+        reference = self.timings.get("reference")
+        for name, elapsed in sorted(self.timings.items(),
+                                    key=lambda item: item[1]):
+            speedup = reference / elapsed if reference and elapsed else 0
+            lines.append("%-14s %8.1f ms  %5.2fx of reference" % (
+                name, elapsed * 1e3, speedup))
+        for counterexample in self.counterexamples:
+            lines.append("")
+            lines.append(counterexample.format())
+        return "\n".join(lines)
+
+
+def to_resource(resource):
+    if isinstance(resource, str) and resource.startswith("~"):
+        return PathPattern(resource[1:])
+    return resource
+
+
+def to_assertion(assertion):
+    if assertion is None:
+        return None
+    name, cost, pure = assertion
+    return Assertion(ASSERTIONS[name], cost=cost, pure=pure)
+
+
+def generate_spec(rng, max_nodes=6, max_rules=12):
+    """Generate a random registry spec with the random generator."""
+    def hierarchy(names):
+        nodes = []
+        for i, name in enumerate(names):
+            parents = rng.sample(names[:i], min(i, rng.randint(0, 2)))
+            nodes.append((name, parents))
+        return nodes
+
+    roles = hierarchy(["r%d" % i for i in range(rng.randint(1, max_nodes))])
+    operations = hierarchy(["o%d" % i for i in range(rng.randint(1, 4))])
+    resources = []
+    for i in range(rng.randint(1, max_nodes)):
+        name = "x%d" % rng.randint(0, 2)
+        if i and rng.random() < 0.6:
+            name = "%s/y%d" % (rng.choice(resources)[0], i)
+        if name not in [r[0] for r in resources]:
+            resources.append((name, []))
+    names = [r[0] for r in resources]
+    resources = [(name, rng.sample(names[:i], min(i, rng.randint(0, 1))))
+                 for i, name in enumerate(names)]
+    patterns = ["~x0/*", "~x1/**", "~*/y1", "~**"]
+
+    rules = []
+    for _ in range(rng.randint(0, max_rules)):
+        assertion = None
+        if rng.random() < 0.35:
+            assertion = (rng.choice(sorted(ASSERTIONS)), rng.randint(0, 3),
+                         rng.random() < 0.3)
+        rules.append((
+            rng.choice(["allow", "deny"]),
+            rng.choice([r[0] for r in roles] + [None]),
+            rng.choice([o[0] for o in operations] + [None]),
+            rng.choice(names + [None] + patterns[:rng.randint(0, 4)]),
+            assertion))
+    return RegistrySpec(roles, resources, operations, rules)
+
+
+def iter_queries(spec, rng):
+    """Iterate the queries ``(roles, operation, resource, kwargs)``."""
+    roles = [r[0] for r in spec.roles]
+    operations = [o[0] for o in spec.operations] + ["unknown"]
+    for role, operation, resource in itertools.product(
+            roles + [None], operations, [r[0] for r in spec.resources]):
+        yield [role], operation, resource, {"flag": rng.random() < 0.5}
+    for _ in range(len(roles) * 2):
+        yield (rng.sample(roles, rng.randint(1, min(3, len(roles)))),
+               rng.choice(operations), rng.choice(spec.resources)[0],
+               {"flag": rng.random() < 0.5})
+
+
+def _ancestors(nodes, current):
+    parents = dict(nodes)
+    family = [current]
+    for node in family:
+        for parent in parents.get(node, ()):
+            if parent not in family:
+                family.append(parent)
+    return family
+
+
+def reference_is_allowed(spec, role, operation, resource, **assertion_kwargs):
+    """Evaluate a check by the plain reading of the semantics.
+
+    A rule matches if its role is the role, an ancestor of the role or None,
+    its resource is the resource, an ancestor of it, a pattern matching one
+    of them or None, and its operation is None or, for the denied rules,
+    the operation or one implied by it, for the allowed rules, the
+    operation or one implying it. A matched denied rule of which the
+    assertion passes denies the access, otherwise a matched allowed rule of
+    which the assertion passes allows it.
+    """
+    roles = _ancestors(spec.roles, role) + [None]
+    resources = _ancestors(spec.resources, resource) + [None]
+
+    def matches(rule):
+        kind, rule_role, rule_operation, rule_resource, assertion = rule
+        if rule_operation is not None:
+            if kind == "deny":
+                implied = _ancestors(spec.operations, operation)
+                if rule_operation not in implied:
+                    return False
+            elif operation not in _ancestors(spec.operations,
+                                             rule_operation):
+                return False
+        if rule_role not in roles:
+            return False
+        if isinstance(rule_resource, str) and rule_resource.startswith("~"):
+            pattern = PathPattern(rule_resource[1:])
+            if not any(pattern.match(r) for r in resources):
+                return False
+        elif rule_resource not in resources:
+            return False
+        return assertion is None or ASSERTIONS[assertion[0]](
+            None, role, operation, resource, **assertion_kwargs)
+
+    rules = spec.effective_rules()
+    if any(matches(rule) for rule in rules if rule[0] == "deny"):
+        return False
+    if any(matches(rule) for rule in rules if rule[0] == "allow"):
+        return True
+    return None
+
+
+def reference_is_any_allowed(spec, roles, operation, resource,
+                             **assertion_kwargs):
+    """Evaluate a check of many roles, as True (allowed) or False."""
+    results = [reference_is_allowed(spec, role, operation, resource,
+                                    **assertion_kwargs) for role in roles]
+    return False not in results and True in results
+
+
+def _registry(spec):
+    return spec.build()
+
+
+def _no_prefilter(spec):
+    acl = Registry()
+    acl.prefilter_rules = False
+    return spec.build(acl)
+
+
+def _lazy_roles(spec):
+    acl = spec.build()
+
+    class LazyRoles(object):
+        def is_allowed(self, *args, **kwargs):
+            return acl.is_allowed(*args, **kwargs)
+
+        def is_any_allowed(self, roles, *args, **kwargs):
+            return acl.is_any_allowed(iter(roles), *args, **kwargs)
+    return LazyRoles()
+
+
+def _role_sets(spec):
+    from .roleset import RoleSetCache
+    acl = spec.build()
+    cache = RoleSetCache(acl)
+    cache.is_allowed = acl.is_allowed
+    return cache
+
+
+def _compiled(spec):
+    from .compiler import compile_registry
+    return compile_registry(spec.build())
+
+
+def _overlay(spec):
+    # the first half of roles is built into the parent, and the rest is
+    # shared by the overlay and the parent, which is changed after the
+    # overlay is created
+    half = len(spec.roles) // 2
+    parent = spec.build(steps=half)
+    overlay = parent.overlay()
+    for i, (method, args) in enumerate(
+            itertools.islice(spec.iter_steps(), half, None)):
+        if i % 2 and _parent_accepts(parent, overlay, method, args):
+            getattr(parent, method)(*args)
+        else:
+            getattr(overlay, method)(*args)
+    return overlay
+
+
+def _parent_accepts(parent, overlay, method, args):
+    """Check whether a step could be applied to the parent of overlay."""
+    if method in ("allow", "deny"):
+        role, operation, resource = args[:3]
+        local_rules = (overlay._allowed if method == "allow" else
+                       overlay._denied).local
+        # the local rule of the same key overrides the parent's one
+        return (role is None or role in parent._roles) and \
+            (resource is None or isinstance(resource, PathPattern) or
+             resource in parent._resources) and \
+            (role, operation, resource) not in local_rules
+    nodes = {"add_role": parent._roles, "add_resource": parent._resources,
+             "add_operation": parent._operations}[method]
+    return all(p in nodes for p in args[1])
+
+
+def _prebuilt(spec):
+    from .prebuilt import dumps, loads
+    return loads(dumps(spec.build()))
+
+
+def _snapshot(spec):
+    return spec.build().snapshot()
+
+
+def _materialized(spec):
+    from .materialized import MaterializedView
+    view = MaterializedView(Registry())
+    spec.build(view)
+    return view
+
+
+def _proxy(spec):
+    from .proxy import RegistryProxy, dummy_factory
+    proxy = RegistryProxy(Registry(), resource_factory=dummy_factory)
+    return spec.build(proxy)
+
+
+#: the factories of the engines to check, which build a engine from a spec.
+ENGINES = {
+    "registry": _registry,
+    "no-prefilter": _no_prefilter,
+    "lazy-roles": _lazy_roles,
+    "role-sets": _role_sets,
+    "compiled": _compiled,
+    "overlay": _overlay,
+    "prebuilt": _prebuilt,
+    "snapshot": _snapshot,
+    "materialized": _materialized,
+    "proxy": _proxy,
+}
+
+
+def evaluate_reference(spec, queries, timings=None):
+    """Evaluate the queries by the reference evaluator."""
+    started = timeit.default_timer()
+    results = []
+    for roles, operation, resource, assertion_kwargs in queries:
+        if len(roles) == 1:
+            results.append(reference_is_allowed(
+                spec, roles[0], operation, resource, **assertion_kwargs))
+        else:
+            results.append(reference_is_any_allowed(
+                spec, roles, operation, resource, **assertion_kwargs))
+    if timings is not None:
+        timings["reference"] = timings.get("reference", 0) + \
+            timeit.default_timer() - started
+    return results
+
+
+def find_mismatch(spec, queries, expected, name, factory, timings=None):
+    """Check a engine with the queries, and get the first mismatch.
+
+    A query of one role is checked by both `is_allowed` and
+    `is_any_allowed`, and a query of many roles is checked by
+    `is_any_allowed`, of which the result is compared as a boolean, since
+    None and False are both not allowed.
+    """
+    engine = factory(spec)
+    timer = timeit.default_timer
+    results = []
+    started = timer()
+    for roles, operation, resource, assertion_kwargs in queries:
+        if len(roles) == 1:
+            result = engine.is_allowed(roles[0], operation, resource,
+                                       **assertion_kwargs)
+        else:
+            result = None
+        results.append((result, bool(engine.is_any_allowed(
+            roles, operation, resource, **assertion_kwargs))))
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + timer() - started
+
+    for query, result, expected_result in zip(queries, results, expected):
+        single, many = result
+        if len(query[0]) == 1 and single != expected_result:
+            return Counterexample(name, spec, "is_allowed", query,
+                                  expected_result, single)
+        if many != bool(expected_result):
+            return Counterexample(name, spec, "is_any_allowed", query,
+                                  bool(expected_result), many)
+    return None
+
+
+def shrink(counterexample, factory):
+    """Shrink the spec of a counterexample while it still fails.
+
+    The rules, resources, roles and operations are removed one by one,
+    except the ones in the query, as long as the engine still fails.
+    """
+    query = counterexample.query
+    roles, operation, resource, assertion_kwargs = query
+    spec = counterexample.spec
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for kind in ("rules", "resources", "roles", "operations"):
+            for index in reversed(range(len(getattr(spec, kind)))):
+                name = getattr(spec, kind)[index][0]
+                if kind != "rules" and name in list(roles) + [operation,
+                                                              resource]:
+                    continue
+                smaller = spec.without(kind, index)
+                try:
+                    found = find_mismatch(
+                        smaller, [query],
+                        evaluate_reference(smaller, [query]),
+                        counterexample.engine, factory)
+                except Exception:
+                    found = None  # a different failure
+                if found is not None:
+                    spec, counterexample, shrunk = smaller, found, True
+    return counterexample
+
+
+def run(seeds=range(100), engines=None, max_nodes=6, max_rules=12):
+    """Check the engines with the random registries of the seeds.
+
+    The counterexamples are shrunk, and at most one is reported per engine
+    and seed.
+    """
+    engines = ENGINES if engines is None else engines
+    report = DifferentialReport()
+    for seed in seeds:
+        rng = random.Random(seed)
+        spec = generate_spec(rng, max_nodes, max_rules)
+        queries = list(iter_queries(spec, rng))
+        expected = evaluate_reference(spec, queries, report.timings)
+        report.seeds += 1
+        report.checks += len(queries) * len(engines)
+        for name in sorted(engines):
+            counterexample = find_mismatch(spec, queries, expected, name,
+                                           engines[name], report.timings)
+            if counterexample is not None:
+                report.counterexamples.append(
+                    shrink(counterexample, engines[name]))
+    return report
+
+
+def _format_argument(arg):
+    if isinstance(arg, Assertion):
+        return "Assertion(%s, cost=%r, pure=%r)" % (
+            arg.func.__name__, arg.cost, arg.pure)
+    if isinstance(arg, PathPattern):
+        return "PathPattern(%r)" % arg.pattern
+    return repr(arg)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m rbac.differential",
+        description="Check the evaluation engines with random registries.")
+    parser.add_argument("--seeds", type=int, default=200)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES),
+                        help="the engines to check, all by default")
+    parser.add_argument("--max-nodes", type=int, default=6)
+    parser.add_argument("--max-rules", type=int, default=12)
+    args = parser.parse_args(argv)
+
+    engines = ENGINES
+    if args.engine:
+        engines = dict((name, ENGINES[name]) for name in args.engine)
+    report = run(range(args.start, args.start + args.seeds), engines,
+                 args.max_nodes, args.max_rules)
+    print(report.format())
+    return 1 if report.counterexamples else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""The batched loading of roles in async services, which requires Python 3.5+.
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import collections
+import weakref
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+
+__all__ = ["BatchRolesLoader"]
+
+
+class BatchRolesLoader(object):
+    """A loader which loads the roles of many users in one batch.
+
+    The keys (such as user ids) requested in one iteration of the event
+    loop are collected, and the `bulk_loader` is called once per
+    `max_batch_size` keys. The `bulk_loader` is a coroutine function which
+    accepts a list of keys, and returns a mapping from keys to roles or a
+    list of roles in the order of keys.
+
+    The loaded roles are cached per event loop for `ttl` seconds, so the
+    revoked roles expire at last, and only the `maxsize` most recently
+    loaded keys are kept. The concurrent requests of one key share one load.
+
+    Example:
+    >>> async def load_user_roles(user_ids):
+    ...     rows = await db.fetch("SELECT user_id, role FROM user_roles "
+    ...                           "WHERE user_id = ANY($1)", user_ids)
+    ...     roles = {}
+    ...     for row in rows:
+    ...         roles.setdefault(row["user_id"], []).append(row["role"])
+    ...     return roles
+    >>> loader = BatchRolesLoader(load_user_roles, max_batch_size=500)
+    >>> context = IdentityContext(acl, loader.roles_loader(
+    ...     lambda: request.current_user.id))
+    >>> await loader.load(request.current_user.id)
+    >>> context.has_permission("view", "article")
+    """
+
+    def __init__(self, bulk_loader, max_batch_size=100, ttl=60.0,
+                 maxsize=10000):
+        self.bulk_loader = bulk_loader
+        self.max_batch_size = max_batch_size
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # the states hold no futures once their loads are done, so they
+        # don't keep the closed loops alive
+        self._states = weakref.WeakKeyDictionary()  # loop -> _LoopState
+
+    async def load(self, key):
+        """Load the roles of a key, and return them as a tuple."""
+        state = self._get_state()
+        roles = self._get_cached(state, key)
+        if roles is not None:
+            return roles
+        return await self._get_future(state, key)
+
+    async def load_many(self, keys):
+        """Load the roles of many keys, and return a list of tuples."""
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def prime(self, key, roles):
+        """Put the roles of a key into the cache of the current loop."""
+        state = self._get_state()
+        roles = tuple(roles)
+        self._put_cached(state, key, roles)
+        future = state.pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(roles)
+
+    def clear(self, key=None):
+        """Drop the cached roles of a key, or all keys if `key` is None."""
+        state = self._get_state()
+        if key is None:
+            state.cache.clear()
+            state.pending.clear()
+        else:
+            state.cache.pop(key, None)
+            state.pending.pop(key, None)
+
+    def roles_loader(self, key_getter):
+        """Create a roles loader for :class:`rbac.context.IdentityContext`.
+
+        The returned function gets the key by calling `key_getter`, and
+        returns the cached roles of it. It is synchronous, so the roles
+        should be loaded by :meth:`load` before checking the permission,
+        otherwise a :class:`LookupError` will be raised.
+        """
+        def load_roles():
+            key = key_getter()
+            roles = self._get_cached(self._get_state(), key)
+            if roles is None:
+                raise LookupError("the roles of %r are not loaded yet" % key)
+            return roles
+        return load_roles
+
+    def _get_state(self):
+        loop = asyncio.get_event_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    def _get_cached(self, state, key):
+        item = state.cache.get(key)
+        if item is None:
+            return None
+        roles, expires = item
+        if expires is not None and expires <= asyncio.get_event_loop().time():
+            del state.cache[key]
+            return None
+        return roles
+
+    def _put_cached(self, state, key, roles):
+        expires = None
+        if self.ttl is not None:
+            expires = asyncio.get_event_loop().time() + self.ttl
+        state.cache.pop(key, None)
+        state.cache[key] = (roles, expires)
+        while len(state.cache) > self.maxsize:
+            state.cache.popitem(last=False)
+
+    def _get_future(self, state, key):
+        future = state.pending.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = state.pending[key] = loop.create_future()
+            if not state.queue:
+                loop.call_soon(self._dispatch, state)
+            state.queue.append((key, future))
+        return future
+
+    def _dispatch(self, state):
+        queue, state.queue = state.queue, []
+        for i in range(0, len(queue), self.max_batch_size):
+            asyncio.ensure_future(
+                self._load_batch(state, queue[i:i + self.max_batch_size]))
+
+    async def _load_batch(self, state, batch):
+        keys = [key for key, future in batch]
+        futures = [future for key, future in batch]
+        try:
+            results = await self.bulk_loader(keys)
+            if isinstance(results, Mapping):
+                results = [results.get(key, ()) for key in keys]
+            else:
+                results = list(results)
+                if len(results) != len(keys):
+                    raise ValueError(
+                        "the bulk loader returned %d results for %d keys" %
+                        (len(results), len(keys)))
+        except Exception as error:
+            for key, future in zip(keys, futures):
+                # the failed loads are not cached
+                if state.pending.get(key) is future:
+                    del state.pending[key]
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for key, future, roles in zip(keys, futures, results):
+            roles = tuple(roles)
+            # the loads dropped by clear() are not cached
+            if state.pending.get(key) is future:
+                del state.pending[key]
+                self._put_cached(state, key, roles)
+            if not future.done():
+                future.set_result(roles)
+
+
+class _LoopState(object):
+    __slots__ = ("cache", "pending", "queue")
+
+    def __init__(self):
+        self.cache = collections.OrderedDict()  # key -> (roles, expires)
+        self.pending = {}  # key -> future of roles being loaded
+        self.queue = []  # the keys and futures waiting for the next batch
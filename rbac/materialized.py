@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+
+import itertools
+
+from .acl import get_family
+from .pattern import PathPattern
+
+
+__all__ = ["MaterializedView"]
+
+
+class MaterializedView(object):
+    """The expanded results of a registry, maintained incrementally.
+
+    The view stores the result of ``acl.is_allowed(role, operation,
+    resource)`` for every registered role and resource and every known
+    operation, except the accesses whose rules have assertions. Only the
+    allowed and denied accesses are stored, the missing ones have no rule.
+
+    The changes should be made through the view, which updates only the
+    affected cells: the descendants of the changed role and resource, and
+    the operations affected by the changed operation. The changes made to
+    the registry directly are detected, and the view will be rebuilt fully.
+
+    Example:
+    >>> view = MaterializedView(acl)
+    >>> view.allow("staff", "edit", "article")
+    >>> view.is_allowed("editor", "edit", "article")
+    True
+    >>> with open("permissions.csv", "w") as report:
+    ...     view.write_csv(report)
+    """
+
+    def __init__(self, acl):
+        self.acl = acl
+        self.rebuild()
+
+    def __len__(self):
+        self._check_revision()
+        return len(self._table)
+
+    def __contains__(self, access):
+        self._check_revision()
+        return access in self._table
+
+    def rebuild(self):
+        """Compute the whole table again."""
+        self._table = {}
+        self._conditional = set()  # the cells depending on assertions
+        self._resource_children = {}
+        for resource, parents in self.acl._resources.items():
+            for parent in parents:
+                self._resource_children.setdefault(parent, set()).add(
+                    resource)
+        self._operations = set(self._iter_operations())
+        self._update(self.acl._roles, self._operations, self.acl._resources)
+        self._revision = self.acl._revision
+
+    def add_role(self, role, parents=[]):
+        self.acl.add_role(role, parents)
+        if not self._check_revision(expected=1):
+            self._update(self._descendants(self.acl._children, role),
+                         self._operations, self.acl._resources)
+
+    def add_resource(self, resource, parents=[]):
+        self.acl.add_resource(resource, parents)
+        if self._check_revision(expected=1):
+            return
+        for parent in parents:
+            self._resource_children.setdefault(parent, set()).add(resource)
+        self._update(self.acl._roles, self._operations,
+                     self._descendants(self._resource_children, resource))
+
+    def add_operation(self, operation, parents=[]):
+        self.acl.add_operation(operation, parents)
+        if self._check_revision(expected=1):
+            return
+        self._operations.update([operation], parents)
+        self._update(self.acl._roles, self._operations, self.acl._resources)
+
+    def allow(self, role, operation, resource, assertion=None):
+        self.acl.allow(role, operation, resource, assertion)
+        if not self._check_revision(expected=1):
+            # the allowed rule applies to the operations implied by it
+            self._update_rule(role, operation, resource, self.acl._operations)
+
+    def deny(self, role, operation, resource, assertion=None):
+        self.acl.deny(role, operation, resource, assertion)
+        if not self._check_revision(expected=1):
+            # the denied rule applies to the operations implying it
+            self._update_rule(role, operation, resource,
+                              self.acl._implying_operations)
+
+    def is_allowed(self, role, operation, resource, **assertion_kwargs):
+        """Check the permission like :meth:`rbac.acl.Registry.is_allowed`.
+
+        The table is looked up if possible, otherwise the registry is used.
+        """
+        self._check_revision()
+        access = (role, operation, resource)
+        if access in self._table:
+            return self._table[access]
+        if access in self._conditional or role not in self.acl._roles or \
+                resource not in self.acl._resources or \
+                operation not in self._operations:
+            return self.acl.is_allowed(role, operation, resource,
+                                       **assertion_kwargs)
+        return None
+
+    def iter_rows(self, chunk_size=1000):
+        """Iterate the lists of ``(role, operation, resource, allowed)``.
+
+        Each list has at most `chunk_size` rows, so the table could be
+        streamed without copying it.
+        """
+        self._check_revision()
+        rows = ((role, operation, resource, allowed) for
+                (role, operation, resource), allowed in self._table.items())
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+    def write_csv(self, fileobj, chunk_size=1000, header=True):
+        """Write the table as CSV into a text file object."""
+        import csv
+        writer = csv.writer(fileobj)
+        if header:
+            writer.writerow(["role", "operation", "resource", "allowed"])
+        for chunk in self.iter_rows(chunk_size):
+            writer.writerows(chunk)
+
+    def write_jsonl(self, fileobj, chunk_size=1000):
+        """Write the table as JSON lines into a text file object."""
+        import json
+        for chunk in self.iter_rows(chunk_size):
+            fileobj.write("".join(json.dumps({
+                "role": role, "operation": operation, "resource": resource,
+                "allowed": allowed}, default=repr) + "\n"
+                for role, operation, resource, allowed in chunk))
+
+    def __getattr__(self, attr):
+        return getattr(self.acl, attr)
+
+    def _check_revision(self, expected=0):
+        """Rebuild the table if the registry was changed elsewhere.
+
+        The `expected` count of changes are made by the view itself. Return
+        True if the table is rebuilt.
+        """
+        if self.acl._revision - expected != self._revision:
+            self.rebuild()
+            return True
+        self._revision = self.acl._revision
+        return False
+
+    def _update_rule(self, role, operation, resource, all_operations):
+        if operation is None:
+            operations = self._operations  # the rule of all operations
+        else:
+            operations = set(get_family(all_operations, operation))
+            operations.discard(None)
+            added = operations - self._operations
+            self._operations.update(operations)
+            if added:
+                # the new operations may be affected by existing rules too
+                self._update(self.acl._roles, added, self.acl._resources)
+                operations -= added
+
+        if role is None:
+            roles = self.acl._roles
+        else:
+            roles = self._descendants(self.acl._children, role)
+
+        if resource is None:
+            resources = self.acl._resources
+        elif isinstance(resource, PathPattern):
+            resources = set(itertools.chain.from_iterable(
+                self._descendants(self._resource_children, r)
+                for r in self.acl._resources if resource.match(r)))
+        else:
+            resources = self._descendants(self._resource_children, resource)
+        self._update(roles, operations, resources)
+
+    def _update(self, roles, operations, resources):
+        for access in itertools.product(roles, operations, resources):
+            self._conditional.discard(access)
+            self._table.pop(access, None)
+            if not self.acl._is_assertion_free([access[0]], *access[1:]):
+                self._conditional.add(access)
+                continue
+            allowed = self.acl.is_allowed(*access)
+            if allowed is not None:
+                self._table[access] = allowed
+
+    def _descendants(self, all_children, current):
+        family = set([current])
+        pending = [current]
+        while pending:
+            for child in all_children.get(pending.pop(), ()):
+                if child not in family:
+                    family.add(child)
+                    pending.append(child)
+        return family
+
+    def _iter_operations(self):
+        for operation, parents in self.acl._operations.items():
+            yield operation
+            for parent in parents:
+                yield parent
+        for rules in (self.acl._allowed, self.acl._denied):
+            for role, operation, resource in rules:
+                if operation is not None:
+                    yield operation
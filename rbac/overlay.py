@@ -0,0 +1,255 @@
+from __future__ import absolute_import
+
+import itertools
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from .acl import SETTINGS, Registry, append_parents, get_family
+from .pattern import PatternIndex
+
+
+__all__ = ["OverlayRegistry"]
+
+
+class OverlayRegistry(Registry):
+    """A copy-on-write registry layered on a parent registry.
+
+    The overlay sees all roles, resources and rules of its parent, including
+    those added to the parent later, but records its own additions locally.
+    The parent is never changed by the overlay, so many overlays could share
+    one parent cheaply. Creating a overlay copies nothing, so it could be
+    created per request, such as for a temporary denied rule.
+
+    The settings of the parent, such as the time budgets of assertions, are
+    inherited unless they are set on the overlay.
+
+    The parent could be a :class:`rbac.acl.RegistrySnapshot` to ignore the
+    later changes, or another overlay to stack the layers. The content hash
+    of a overlay is the hash of its parent plus its local additions, so it is
+    inexact if the parent adds the same items later.
+
+    Example:
+    >>> overlay = OverlayRegistry(acl)
+    >>> overlay.deny("staff", "edit", "article")
+    >>> acl.is_allowed("staff", "edit", "article")
+    True
+    >>> overlay.is_allowed("staff", "edit", "article")
+    False
+    """
+
+    def __init__(self, parent):
+        self._parent = parent
+        self._local_revision = 0
+        self._parent_revision = parent._revision
+        self._local_digest = 0
+
+        self._roles = _LayeredSets(parent._roles)
+        self._resources = _LayeredSets(parent._resources)
+        self._allowed = _LayeredDict(parent._allowed)
+        self._denied = _LayeredDict(parent._denied)
+        self._allowed_index = tuple(
+            _LayeredSet(s) for s in parent._allowed_index)
+        self._denied_index = tuple(
+            _LayeredSet(s) for s in parent._denied_index)
+
+        self._operations = _LayeredSets(parent._operations)
+        self._implying_operations = _LayeredSets(
+            parent._implying_operations)
+        self._operation_families = {}
+
+        self._patterns = _LayeredPatterns(parent._patterns)
+
+        self._denial_only_roles = _LayeredSet(parent._denial_only_roles)
+        self._children = _LayeredSets(parent._children)
+
+        self._grants = _LayeredSets(parent._grants)
+        self._family_grants = {}
+
+        self._plans = {}
+        self._plans_revision = 0
+
+        self._family_maxima = None
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def _revision(self):
+        return self._parent._revision + self._local_revision
+
+    @_revision.setter
+    def _revision(self, revision):
+        self._local_revision = revision - self._parent._revision
+
+    @property
+    def _content_digest(self):
+        return (self._parent._content_digest + self._local_digest) % (1 << 128)
+
+    @_content_digest.setter
+    def _content_digest(self, digest):
+        self._local_digest = digest - self._parent._content_digest
+
+    def _sync_caches(self):
+        """Drop the local caches if the parent has been changed."""
+        if isinstance(self._parent, OverlayRegistry):
+            self._parent._sync_caches()
+        revision = self._parent._revision
+        if revision != self._parent_revision:
+            self._parent_revision = revision
+            self._clear_caches()
+            self._sync_denial_only_roles()
+
+    def _sync_denial_only_roles(self):
+        # the roles added or reparented locally are not the children of
+        # their parents in the parent registry, so the later allowed rules
+        # of the parent could not clear their deny-only marks
+        roles = set(self._denial_only_roles.added)
+        roles.update(self._roles.local)
+        for role in roles:
+            if role in self._denial_only_roles and any(
+                    r in self._grants for r in get_family(self._roles, role)):
+                self._denial_only_roles.discard(role)
+
+    def _get_operation_families(self, operation):
+        self._sync_caches()
+        return super(OverlayRegistry, self)._get_operation_families(operation)
+
+    def _get_assertion_executor(self):
+        # the overlays are cheap and many, so they share the parent's pool
+        return self._parent._get_assertion_executor()
+
+    def _role_may_grant(self, role, candidates):
+        self._sync_caches()
+        return super(OverlayRegistry, self)._role_may_grant(role, candidates)
+
+
+class _Inherited(object):
+    """A setting which falls back to the parent unless it is set locally."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return getattr(Registry, self.name)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            return getattr(instance._parent, self.name)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+    def __delete__(self, instance):
+        instance.__dict__.pop(self.name, None)
+
+
+for _name in SETTINGS:
+    setattr(OverlayRegistry, _name, _Inherited(_name))
+del _name
+
+
+class _LayeredDict(Mapping):
+    """A mapping which writes locally and falls back to its parent."""
+
+    __slots__ = ("local", "parent")
+
+    def __init__(self, parent):
+        self.local = {}
+        self.parent = parent
+
+    def __getitem__(self, key):
+        try:
+            return self.local[key]
+        except KeyError:
+            return self.parent[key]
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+
+    def __contains__(self, key):
+        return key in self.local or key in self.parent
+
+    def __iter__(self):
+        return itertools.chain(
+            self.local, (key for key in self.parent if key not in self.local))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _LayeredSets(_LayeredDict):
+    """A mapping of sets or tuples, merging the local and parent values."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        local = self.local.get(key)
+        parent = self.parent.get(key)
+        if local is None:
+            if parent is None:
+                raise KeyError(key)
+            return parent
+        if parent is None:
+            return local
+        if isinstance(local, tuple):
+            return append_parents(tuple(parent), local)
+        return local | set(parent)
+
+    def setdefault(self, key, default):
+        return self.local.setdefault(key, default)
+
+
+class _LayeredSet(object):
+    """A set which records the local additions and removals."""
+
+    __slots__ = ("added", "removed", "parent")
+
+    def __init__(self, parent):
+        self.added = set()
+        self.removed = set()
+        self.parent = parent
+
+    def __contains__(self, item):
+        if item in self.added:
+            return True
+        return item in self.parent and item not in self.removed
+
+    def add(self, item):
+        self.added.add(item)
+        self.removed.discard(item)
+
+    def discard(self, item):
+        self.added.discard(item)
+        if item in self.parent:
+            self.removed.add(item)
+
+
+class _LayeredPatterns(object):
+    """A pattern index which matches the local and parent patterns."""
+
+    __slots__ = ("local", "parent")
+
+    def __init__(self, parent):
+        self.local = PatternIndex()
+        self.parent = parent
+
+    def __len__(self):
+        return len(self.local) + len(self.parent)
+
+    def __contains__(self, pattern):
+        return pattern in self.local or pattern in self.parent
+
+    def __iter__(self):
+        return itertools.chain(self.parent, self.local)
+
+    def add(self, pattern):
+        if pattern not in self.parent:
+            self.local.add(pattern)
+
+    def match(self, path):
+        return self.parent.match(path) + self.local.match(path)
@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+
+__all__ = ["PathPattern", "PatternIndex"]
+
+
+try:
+    string_types = basestring  # noqa: F821
+except NameError:
+    string_types = str
+
+
+class PathPattern(object):
+    """A pattern of path-like resources, such as ``/org/*/project/**``.
+
+    The pattern is split by "/". A ``*`` segment matches any one segment and a
+    trailing ``**`` segment matches any remaining segments (including none).
+
+    A rule with a pattern as its resource covers all matched resources, and
+    those resources don't need to be added into the registry individually.
+    """
+
+    __slots__ = ("pattern", "segments", "is_prefix")
+
+    separator = "/"
+    any_segment = "*"
+    any_segments = "**"
+
+    def __init__(self, pattern):
+        segments = pattern.split(self.separator)
+        is_prefix = segments[-1] == self.any_segments
+        if is_prefix:
+            segments.pop()
+        if self.any_segments in segments:
+            raise ValueError("%r is only allowed at the end of a pattern: %r"
+                             % (self.any_segments, pattern))
+        self.pattern = pattern
+        self.segments = tuple(segments)
+        self.is_prefix = is_prefix
+
+    def __repr__(self):
+        return "PathPattern(%r)" % self.pattern
+
+    def __eq__(self, other):
+        return (isinstance(other, PathPattern) and
+                self.pattern == other.pattern)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((PathPattern, self.pattern))
+
+    def match(self, path):
+        """Check whether the path is matched by this pattern."""
+        if not isinstance(path, string_types):
+            return False
+        segments = path.split(self.separator)
+        if self.is_prefix:
+            segments = segments[:len(self.segments)]
+        if len(segments) != len(self.segments):
+            return False
+        return all(expected in (self.any_segment, segment)
+                   for expected, segment in zip(self.segments, segments))
+
+
+class _Node(object):
+    __slots__ = ("children", "wildcard", "exact", "prefix")
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.exact = []
+        self.prefix = []
+
+
+class PatternIndex(object):
+    """A trie of path patterns, matching a path in O(path length)."""
+
+    def __init__(self, patterns=()):
+        self._root = _Node()
+        self._patterns = set()
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self._patterns
+
+    def add(self, pattern):
+        """Add a pattern into the index."""
+        if pattern in self._patterns:
+            return
+        self._patterns.add(pattern)
+
+        node = self._root
+        for segment in pattern.segments:
+            if segment == pattern.any_segment:
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if pattern.is_prefix:
+            node.prefix.append(pattern)
+        else:
+            node.exact.append(pattern)
+
+    def match(self, path):
+        """Get all patterns which match the path."""
+        if not self._patterns or not isinstance(path, string_types):
+            return []
+
+        matched = []
+        nodes = [self._root]
+        for segment in path.split(PathPattern.separator):
+            next_nodes = []
+            for node in nodes:
+                matched.extend(node.prefix)
+                child = node.children.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                if node.wildcard is not None:
+                    next_nodes.append(node.wildcard)
+            nodes = next_nodes
+            if not nodes:
+                return matched
+        for node in nodes:
+            matched.extend(node.prefix)
+            matched.extend(node.exact)
+        return matched
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+
+import marshal
+
+from .acl import Registry
+from .pattern import PathPattern
+
+
+__all__ = ["dump", "dumps", "load", "loads", "write_module"]
+
+
+FORMAT_VERSION = 1
+
+# the tables of a registry which are stored, the caches are not stored
+_TABLES = ("_roles", "_resources", "_allowed", "_denied", "_operations",
+           "_implying_operations", "_denial_only_roles", "_children",
+           "_grants")
+
+
+def dumps(acl):
+    """Serialize a registry into bytes, which could be loaded in one step.
+
+    The registry is stored by :mod:`marshal` if all roles, resources,
+    operations and assertions are built-in types (such as strings and
+    tuples), which is fast to load. Otherwise it is stored by :mod:`pickle`,
+    so the objects should be picklable.
+    """
+    snapshot = acl.snapshot()
+    state = dict((name, getattr(snapshot, name)) for name in _TABLES)
+    state["_content_digest"] = snapshot._content_digest
+    state["_patterns"] = [p.pattern for p in snapshot._patterns]
+    try:
+        return b"M" + marshal.dumps((FORMAT_VERSION, state))
+    except ValueError:  # unmarshallable objects
+        import pickle
+        return b"P" + pickle.dumps((FORMAT_VERSION, state), protocol=2)
+
+
+def loads(data):
+    """Load a registry from the bytes created by :func:`dumps`."""
+    kind, data = data[:1], data[1:]
+    if kind == b"M":
+        version, state = marshal.loads(data)
+    elif kind == b"P":
+        import pickle
+        version, state = pickle.loads(data)
+    else:
+        raise ValueError("unknown format of prebuilt registry")
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported version of prebuilt registry: %r"
+                         % version)
+
+    acl = Registry()
+    for pattern in state.pop("_patterns"):
+        acl._patterns.add(PathPattern(pattern))
+    for name, value in state.items():
+        setattr(acl, name, value)
+    acl._index_rules()
+    return acl
+
+
+def dump(acl, fp):
+    """Serialize a registry into a binary file object."""
+    fp.write(dumps(acl))
+
+
+def load(fp):
+    """Load a registry from a binary file object."""
+    return loads(fp.read())
+
+
+def write_module(acl, path, name="registry"):
+    """Write a Python module which provides a prebuilt registry.
+
+    The generated module could be imported, frozen or bundled like any
+    other module, and the registry is its attribute `name`.
+    """
+    with open(path, "w") as module_file:
+        module_file.write(
+            "# generated by rbac.prebuilt, content hash %s\n"
+            "from rbac.prebuilt import loads as _loads\n"
+            "\n"
+            "%s = _loads(%r)\n" % (acl.content_hash, name, dumps(acl)))
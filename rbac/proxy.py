@@ -13,8 +13,15 @@ role_identity = functools.partial(identity, "role-model")
 resource_identity = functools.partial(identity, "resource-model")
 
 
+# the full names of classes, shared by all identity tuples of a class
+_fullnames = {}
+
+
 def GetFullName(m):
-    return "%s.%s" % (m.__module__, m.__name__)
+    try:
+        return _fullnames[m]
+    except KeyError:
+        return _fullnames.setdefault(m, "%s.%s" % (m.__module__, m.__name__))
 
 
 def DummyFactory(acl, obj):
@@ -102,7 +109,10 @@ class RegistryProxy(object):
                                    resource, **assertion_kwargs)
 
     def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
-        roles = [self.make_role(role) for role in roles]
+        if isinstance(roles, (list, tuple)):
+            roles = [self.make_role(role) for role in roles]
+        else:
+            roles = (self.make_role(role) for role in roles)
         resource = self.make_resource(resource)
         return self.acl.is_any_allowed(roles, operation,
                                        resource, **assertion_kwargs)
@@ -0,0 +1,287 @@
+"""The recording of decisions and the replay of them for load testing.
+
+The decisions are recorded by :class:`RecordingRegistry` into a log of JSON
+lines, one ``[roles, operation, resource, result, latency]`` per line,
+where the latency is in microseconds, followed by the assertion arguments
+if there are any. The log could be replayed by :func:`replay` or the
+command line tool::
+
+    python -m rbac.replay decisions.log policy.rbac --compiled \\
+        --against new-policy.rbac --processes 4
+"""
+
+from __future__ import absolute_import, print_function
+
+import itertools
+import json
+import random
+import threading
+import timeit
+
+
+__all__ = ["DecisionRecorder", "RecordingRegistry", "ReplayReport",
+           "load_engines", "read_log", "replay", "replay_files"]
+
+
+class DecisionRecorder(object):
+    """A recorder which appends the decisions to a text file object.
+
+    Only `sample_rate` of decisions are recorded. The lines are buffered
+    and written `buffer_size` lines at a time, so :meth:`flush` should be
+    called at last.
+    """
+
+    def __init__(self, fileobj, sample_rate=1.0, buffer_size=1000):
+        self.fileobj = fileobj
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        """Decide whether to record the next decision."""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, roles, operation, resource, result, latency,
+               assertion_kwargs=None):
+        record = [list(roles), operation, resource, result,
+                  round(latency * 1e6, 1)]
+        if assertion_kwargs:
+            record.append(assertion_kwargs)
+        line = json.dumps(record, separators=(",", ":"), default=repr)
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.buffer_size:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+        self.fileobj.flush()
+
+    def _write(self):
+        if self._buffer:
+            self.fileobj.write("\n".join(self._buffer) + "\n")
+            del self._buffer[:]
+
+
+class RecordingRegistry(object):
+    """A proxy of the registry which records the sampled decisions.
+
+    It could be used by :class:`rbac.context.IdentityContext` in place of
+    the registry. The decisions of :meth:`is_any_allowed` are recorded, and
+    the roles of a sampled one are pulled into a list before checking.
+
+    Example:
+    >>> recorder = DecisionRecorder(open("decisions.log", "a"), 0.01)
+    >>> context = IdentityContext(RecordingRegistry(acl, recorder))
+    """
+
+    def __init__(self, acl, recorder):
+        self.acl = acl
+        self.recorder = recorder
+
+    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
+        if not self.recorder.sampled():
+            return self.acl.is_any_allowed(roles, operation, resource,
+                                           **assertion_kwargs)
+        roles = list(roles)
+        started = timeit.default_timer()
+        result = self.acl.is_any_allowed(roles, operation, resource,
+                                         **assertion_kwargs)
+        self.recorder.record(roles, operation, resource, result,
+                             timeit.default_timer() - started,
+                             assertion_kwargs)
+        return result
+
+    def __getattr__(self, attr):
+        return getattr(self.acl, attr)
+
+
+class ReplayReport(object):
+    """The throughput, latency histograms and mismatches of a replay.
+
+    The histograms map the power-of-two buckets of latency in microseconds
+    to the counts of checks. The mismatches are tuples of ``(record, engine,
+    result)``, where the engine grants the access but the recorded result
+    doesn't, or vice versa. The errors are tuples of ``(record, engine,
+    error)``, where the check of engine raises a error, formatted by `repr`.
+    """
+
+    def __init__(self, engines):
+        self.count = 0
+        self.elapsed = dict((name, 0.0) for name in engines)
+        self.histograms = dict((name, {}) for name in engines)
+        self.mismatches = []
+        self.errors = []
+
+    def merge(self, other):
+        self.count += other.count
+        for name, elapsed in other.elapsed.items():
+            self.elapsed[name] += elapsed
+        for name, histogram in other.histograms.items():
+            for bucket, count in histogram.items():
+                self.histograms[name][bucket] = \
+                    self.histograms[name].get(bucket, 0) + count
+        self.mismatches.extend(other.mismatches)
+        self.errors.extend(other.errors)
+        return self
+
+    def throughput(self, engine):
+        elapsed = self.elapsed[engine]
+        return self.count / elapsed if elapsed else float("inf")
+
+    def percentile(self, engine, fraction):
+        """Get the upper bound of the bucket of a percentile, in us."""
+        histogram = self.histograms[engine]
+        remaining = fraction * sum(histogram.values())
+        for bucket in sorted(histogram):
+            remaining -= histogram[bucket]
+            if remaining <= 0:
+                return 1 << bucket
+        return 0
+
+    def format(self):
+        lines = ["%d checks replayed, %d mismatches, %d errors" % (
+            self.count, len(self.mismatches), len(self.errors))]
+        for name in sorted(self.elapsed):
+            lines.append("%-10s %10.0f checks/s  p50 <%6d us  p99 <%6d us" % (
+                name, self.throughput(name), self.percentile(name, 0.5),
+                self.percentile(name, 0.99)))
+            histogram = self.histograms[name]
+            for bucket in sorted(histogram):
+                lines.append("    <%6d us %8d" % (1 << bucket,
+                                                  histogram[bucket]))
+        for record, engine, result in self.mismatches[:20]:
+            lines.append("mismatch %s: %r recorded %r, got %r" % (
+                engine, record[:3], record[3], result))
+        for record, engine, error in self.errors[:20]:
+            lines.append("error %s: %r raised %s" % (engine, record[:3],
+                                                     error))
+        return "\n".join(lines)
+
+
+def read_log(fileobj):
+    """Iterate the records of a decision log.
+
+    The JSON arrays of roles and resources are turned back into tuples.
+    """
+    for line in fileobj:
+        if line.strip():
+            record = json.loads(line)
+            record[0] = [to_hashable(role) for role in record[0]]
+            record[2] = to_hashable(record[2])
+            yield record
+
+
+def to_hashable(value):
+    if isinstance(value, list):
+        return tuple(to_hashable(item) for item in value)
+    return value
+
+
+def replay(engines, records):
+    """Replay the records against the engines, and get a report.
+
+    The `engines` maps names to functions like
+    :meth:`rbac.acl.Registry.is_any_allowed`. The records are the lists
+    read by :func:`read_log`. A check raising a error is reported in the
+    errors, and the replay goes on.
+    """
+    report = ReplayReport(engines)
+    timer = timeit.default_timer
+    for record in records:
+        roles, operation, resource, result = record[:4]
+        assertion_kwargs = record[5] if len(record) > 5 else {}
+        report.count += 1
+        for name, check in engines.items():
+            started = timer()
+            try:
+                current = check(roles, operation, resource,
+                                **assertion_kwargs)
+            except Exception as error:
+                report.errors.append((record, name, repr(error)))
+                continue
+            elapsed = timer() - started
+            report.elapsed[name] += elapsed
+            bucket = int(elapsed * 1e6).bit_length()
+            histogram = report.histograms[name]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+            if bool(current) != bool(result):
+                report.mismatches.append((record, name, current))
+    return report
+
+
+def load_engines(registry_path, compiled=False, against=None):
+    """Load the engines to replay from the prebuilt registry files."""
+    from .prebuilt import load
+    with open(registry_path, "rb") as registry_file:
+        acl = load(registry_file)
+    engines = {"registry": acl.is_any_allowed}
+    if compiled:
+        from .compiler import compile_registry
+        engines["compiled"] = compile_registry(acl).is_any_allowed
+    if against is not None:
+        with open(against, "rb") as registry_file:
+            engines["against"] = load(registry_file).is_any_allowed
+    return engines
+
+
+def _replay_chunk(args):
+    engine_args, records = args
+    return replay(load_engines(*engine_args), records)
+
+
+def replay_files(log_path, registry_path, compiled=False, against=None,
+                 processes=1, chunk_size=10000):
+    """Replay a decision log against a prebuilt registry file.
+
+    The log is split into chunks of `chunk_size` records, which are replayed
+    across a pool of `processes` processes if it is more than one.
+    """
+    engine_args = (registry_path, compiled, against)
+    engines = load_engines(*engine_args)
+    with open(log_path) as log_file:
+        records = read_log(log_file)
+        if processes <= 1:
+            return replay(engines, records)
+
+        import multiprocessing
+        chunks = iter(lambda: list(itertools.islice(records, chunk_size)),
+                      [])
+        report = ReplayReport(engines)
+        pool = multiprocessing.Pool(processes)
+        try:
+            for part in pool.imap_unordered(
+                    _replay_chunk, ((engine_args, chunk) for chunk in chunks)):
+                report.merge(part)
+        finally:
+            pool.terminate()
+        return report
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="python -m rbac.replay",
+        description="Replay a decision log against a prebuilt registry.")
+    parser.add_argument("log", help="the log written by DecisionRecorder")
+    parser.add_argument("registry", help="the file written by "
+                                         "rbac.prebuilt.dump")
+    parser.add_argument("--compiled", action="store_true",
+                        help="replay against the compiled policy as well")
+    parser.add_argument("--against", metavar="REGISTRY",
+                        help="replay against another prebuilt registry")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    report = replay_files(args.log, args.registry, args.compiled,
+                          args.against, args.processes, args.chunk_size)
+    print(report.format())
+    return 1 if report.mismatches or report.errors else 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
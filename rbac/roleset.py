@@ -0,0 +1,120 @@
+from __future__ import absolute_import
+
+
+__all__ = ["RoleSet", "RoleSetCache"]
+
+# the cached mark of the accesses depending on assertions
+_CONDITIONAL = object()
+
+
+class RoleSet(tuple):
+    """An immutable and hashable combination of roles.
+
+    The duplicated roles are dropped and the others keep the order they are
+    given in, so the precedence of evaluation is preserved. But the role sets
+    are compared and hashed regardless of the order, so the same roles given
+    in any order make up one combination.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, roles=()):
+        seen = set()
+        unique = [r for r in roles if not (r in seen or seen.add(r))]
+        return super(RoleSet, cls).__new__(cls, unique)
+
+    def __eq__(self, other):
+        if not isinstance(other, RoleSet):
+            return NotImplemented
+        return len(self) == len(other) and frozenset(self) == frozenset(other)
+
+    def __ne__(self, other):
+        is_equal = self.__eq__(other)
+        return is_equal if is_equal is NotImplemented else not is_equal
+
+    def __hash__(self):
+        return hash(frozenset(self))
+
+    def __repr__(self):
+        return "RoleSet(%r)" % (list(self),)
+
+
+class RoleSetCache(object):
+    """The interned role sets and their effective permissions.
+
+    Many users usually share a few distinct combinations of roles. This cache
+    interns those combinations and remembers the result of checking each of
+    them, so the access control list is only evaluated once per role set.
+
+    The results which depend on assertions are never cached, but the fact
+    that they depend on assertions is. All cached results are dropped while
+    the access control list is changed.
+
+    Example:
+    >>> cache = RoleSetCache(acl)
+    >>> staff = cache.intern(["staff", "editor"])
+    >>> cache.is_any_allowed(staff, "edit", "article")
+    """
+
+    def __init__(self, acl, maxsize=65536):
+        self.acl = acl
+        self.maxsize = maxsize
+        self._role_sets = {}
+        self._permissions = {}
+        self._revision = acl._revision
+
+    def intern(self, roles):
+        """Get the canonical role set of the roles.
+
+        The roles given in any order share one role set, which keeps the
+        order of the roles it is first interned with.
+        """
+        if isinstance(roles, RoleSet):
+            key = roles
+        else:
+            key = tuple(roles)
+        role_set = self._role_sets.get(key)
+        if role_set is None:
+            if len(self._role_sets) >= self.maxsize:
+                self._role_sets.clear()
+            role_set = RoleSet(key)
+            role_set = self._role_sets.setdefault(role_set, role_set)
+            self._role_sets[key] = role_set
+        return role_set
+
+    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
+        """Check the permission with a role set, using the cached result."""
+        role_set = self.intern(roles)
+        if assertion_kwargs:
+            return self.acl.is_any_allowed(role_set, operation, resource,
+                                           **assertion_kwargs)
+
+        if self._revision != self.acl._revision:
+            self._permissions.clear()
+            self._revision = self.acl._revision
+
+        key = (role_set, operation, resource)
+        try:
+            is_allowed = self._permissions[key]
+        except KeyError:
+            pass
+        else:
+            if is_allowed is _CONDITIONAL:
+                return self.acl.is_any_allowed(role_set, operation, resource)
+            return is_allowed
+
+        is_allowed = self.acl.is_any_allowed(role_set, operation, resource)
+        if len(self._permissions) >= self.maxsize:
+            self._permissions.clear()
+        if self.acl._is_assertion_free(role_set, operation, resource):
+            self._permissions[key] = is_allowed
+        else:
+            # remember that the access depends on assertions, to skip
+            # scanning the rules again
+            self._permissions[key] = _CONDITIONAL
+        return is_allowed
+
+    def clear(self):
+        """Drop all interned role sets and cached results."""
+        self._role_sets.clear()
+        self._permissions.clear()
@@ -0,0 +1,366 @@
+"""A local decision service of a registry, which requires Python 3.5+.
+
+The server is started by ``python -m rbac.server``. It loads a registry
+which is prebuilt by :func:`rbac.prebuilt.dump`, and listens on a Unix
+socket or a localhost TCP port::
+
+    python -m rbac.server policy.rbac --unix /run/rbac.sock
+    python -m rbac.server policy.rbac --port 7010
+
+Each frame is a 4-byte big-endian length followed by a JSON object. A
+request is ``{"id": 1, "checks": [[roles, operation, resource], ...]}``,
+where a check could have a fourth item, the assertion keyword arguments.
+The response is ``{"id": 1, "results": [true, false, null, ...]}``, or
+``{"id": 1, "error": "..."}`` if the request could not be evaluated. The
+requests could be pipelined, and the responses carry the ids of requests
+since they may be sent out of order.
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import itertools
+import json
+import struct
+
+
+__all__ = ["DecisionServer", "DecisionClient"]
+
+
+_HEADER = struct.Struct(">I")
+
+#: the maximum length of a frame, to reject the broken peers early.
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(message):
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    """Read a message, or return None if the peer closed the stream."""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    size, = _HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError("the frame is too large: %d bytes" % size)
+    payload = await reader.readexactly(size)
+    return json.loads(payload.decode("utf-8"))
+
+
+class DecisionServer(object):
+    """The server of the decisions of a registry.
+
+    The requests received in one iteration of the event loop, from all
+    connections, are coalesced into one batch evaluation, in which the
+    repeated checks are evaluated once.
+
+    Example:
+    >>> server = DecisionServer(acl)
+    >>> await server.start(path="/run/rbac.sock")
+    >>> await server.serve_forever()
+    """
+
+    def __init__(self, acl, max_batch_size=1024):
+        self.acl = acl
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._flushing = False
+        self._server = None
+        self._closed = None
+        self._handlers = {}  # writer -> future done with the connection
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """Listen on a Unix socket `path`, or on the TCP `host` and `port`.
+        """
+        self._closed = asyncio.Event()
+        if path is not None:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path)
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, host, port)
+        return self._server
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server is not None else []
+
+    async def serve_forever(self):
+        """Wait until the server is closed."""
+        await self._closed.wait()
+
+    def close(self):
+        """Stop listening and close all connections."""
+        if self._server is not None:
+            self._server.close()
+            self._closed.set()
+        for writer in self._handlers:
+            writer.close()
+
+    async def wait_closed(self):
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        await asyncio.gather(*self._handlers.values())
+
+    def evaluate(self, checks):
+        """Evaluate a batch of checks, and return the list of results."""
+        results = []
+        memo = {}
+        for check in checks:
+            roles, operation, resource = check[:3]
+            assertion_kwargs = check[3] if len(check) > 3 else None
+            if assertion_kwargs:
+                results.append(self.acl.is_any_allowed(
+                    roles, operation, resource, **assertion_kwargs))
+                continue
+            key = (tuple(roles), operation, resource)
+            if key not in memo:
+                memo[key] = self.acl.is_any_allowed(
+                    key[0], operation, resource)
+            results.append(memo[key])
+        return results
+
+    def submit(self, checks):
+        """Queue a list of checks, and get a future of the results."""
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((checks, future))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.get_event_loop().call_soon(self._flush)
+        return future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        self._flushing = False
+        batch, size = [], 0
+        for checks, future in pending:
+            if batch and size + len(checks) > self.max_batch_size:
+                self._evaluate_batch(batch)
+                batch, size = [], 0
+            batch.append((checks, future))
+            size += len(checks)
+        if batch:
+            self._evaluate_batch(batch)
+
+    def _evaluate_batch(self, batch):
+        try:
+            results = self.evaluate(list(itertools.chain.from_iterable(
+                checks for checks, future in batch)))
+        except Exception:
+            # evaluate the requests one by one to find the broken ones
+            for checks, future in batch:
+                try:
+                    future.set_result(self.evaluate(checks))
+                except Exception as error:
+                    future.set_exception(error)
+            return
+        offset = 0
+        for checks, future in batch:
+            future.set_result(results[offset:offset + len(checks)])
+            offset += len(checks)
+
+    async def _handle_connection(self, reader, writer):
+        def respond(request_id, future):
+            if writer.transport.is_closing():
+                return
+            if future.exception() is not None:
+                message = {"id": request_id, "error": "%s: %s" % (
+                    type(future.exception()).__name__, future.exception())}
+            else:
+                message = {"id": request_id, "results": future.result()}
+            writer.write(encode_frame(message))
+
+        done = asyncio.get_event_loop().create_future()
+        self._handlers[writer] = done
+        try:
+            while True:
+                request = await read_frame(reader)
+                if request is None:
+                    break
+                future = self.submit(request["checks"])
+                future.add_done_callback(
+                    lambda f, request_id=request.get("id"):
+                    respond(request_id, f))
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError, TypeError):
+            pass  # drop the broken connection
+        finally:
+            writer.close()
+            del self._handlers[writer]
+            done.set_result(None)
+
+
+class DecisionClient(object):
+    """The pooled client of :class:`DecisionServer`.
+
+    The checks are sent over `pool_size` connections in turn. The concurrent
+    checks on one connection are coalesced into one request per iteration
+    of the event loop.
+
+    Example:
+    >>> client = DecisionClient(path="/run/rbac.sock")
+    >>> await client.is_any_allowed(["staff"], "edit", "article")
+    True
+    >>> await client.check_many([(["staff"], "edit", "article"),
+    ...                          (["staff"], "delete", "article")])
+    [True, None]
+    >>> client.close()
+    >>> await client.wait_closed()
+    """
+
+    def __init__(self, path=None, host="127.0.0.1", port=None, pool_size=4):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._connections = []
+        self._turn = itertools.count()
+
+    async def is_any_allowed(self, roles, operation, resource,
+                             **assertion_kwargs):
+        check = [list(roles), operation, resource]
+        if assertion_kwargs:
+            check.append(assertion_kwargs)
+        results = await self.check_many([check])
+        return results[0]
+
+    async def check_many(self, checks):
+        """Evaluate many checks, and return the list of results."""
+        connection = await self._get_connection()
+        return await connection.submit(
+            [[list(check[0])] + list(check[1:]) for check in checks])
+
+    def close(self):
+        for connecting in self._connections:
+            if not connecting.done():
+                connecting.cancel()
+            elif _is_connected(connecting):
+                connecting.result().close()
+
+    async def wait_closed(self):
+        connections, self._connections = self._connections, []
+        await asyncio.gather(*[
+            c.result().reading for c in connections if _is_connected(c)],
+            return_exceptions=True)
+
+    async def _get_connection(self):
+        # drop the closed connections, and open new ones to fill the pool
+        self._connections = [
+            c for c in self._connections
+            if not c.done() or _is_connected(c) and not c.result().closed]
+        if len(self._connections) < self.pool_size:
+            self._connections.append(asyncio.ensure_future(self._connect()))
+        connecting = self._connections[
+            next(self._turn) % len(self._connections)]
+        return await asyncio.shield(connecting)
+
+    async def _connect(self):
+        if self.path is not None:
+            streams = await asyncio.open_unix_connection(self.path)
+        else:
+            streams = await asyncio.open_connection(self.host, self.port)
+        return _Connection(*streams)
+
+
+def _is_connected(connecting):
+    return not connecting.cancelled() and connecting.exception() is None
+
+
+class _Connection(object):
+    """A pipelined connection of the client."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._waiters = {}
+        self._queued = []
+        self.reading = asyncio.ensure_future(self._read_responses())
+
+    def submit(self, checks):
+        future = asyncio.get_event_loop().create_future()
+        if not self._queued:
+            asyncio.get_event_loop().call_soon(self._send)
+        self._queued.append((checks, future))
+        return future
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+        self.reading.cancel()
+
+    def _send(self):
+        queued, self._queued = self._queued, []
+        request_id = next(self._ids)
+        self._waiters[request_id] = queued
+        self.writer.write(encode_frame({
+            "id": request_id,
+            "checks": list(itertools.chain.from_iterable(
+                checks for checks, future in queued))}))
+
+    async def _read_responses(self):
+        error = ConnectionError("the connection is closed")
+        try:
+            while True:
+                response = await read_frame(self.reader)
+                if response is None:
+                    break
+                queued = self._waiters.pop(response["id"])
+                if "error" in response:
+                    for checks, future in queued:
+                        future.set_exception(RuntimeError(response["error"]))
+                    continue
+                results = response["results"]
+                offset = 0
+                for checks, future in queued:
+                    future.set_result(results[offset:offset + len(checks)])
+                    offset += len(checks)
+        except Exception as e:
+            error = e
+        finally:
+            self.closed = True
+            for queued in self._waiters.values():
+                for checks, future in queued:
+                    if not future.done():
+                        future.set_exception(error)
+            self._waiters.clear()
+
+
+def main(argv=None):
+    import argparse
+    from .prebuilt import load
+
+    parser = argparse.ArgumentParser(
+        prog="python -m rbac.server",
+        description="Serve the decisions of a prebuilt registry.")
+    parser.add_argument("registry", help="the file written by "
+                                         "rbac.prebuilt.dump")
+    parser.add_argument("--unix", metavar="PATH",
+                        help="listen on the Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7010)
+    parser.add_argument("--max-batch-size", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    with open(args.registry, "rb") as registry_file:
+        acl = load(registry_file)
+    server = DecisionServer(acl, max_batch_size=args.max_batch_size)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start(args.unix, args.host, args.port))
+    try:
+        loop.run_until_complete(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+from __future__ import absolute_import
+
+import multiprocessing
+import threading
+
+from .acl import Registry, fingerprint, get_parents
+from .pattern import PathPattern
+
+
+__all__ = ["ShardedRegistry"]
+
+
+class ShardedRegistry(object):
+    """A registry partitioned by the resource trees into worker processes.
+
+    Each shard is a local process with its own registry. A resource tree,
+    the top-level resource and all its descendants, belongs to one shard,
+    and the rules of these resources are kept by this shard only. The roles
+    and operations are replicated to every shard, and so are the rules of
+    None resource and of :class:`rbac.pattern.PathPattern`, since they could
+    match any resource.
+
+    A check is routed to the shard owning its resource, and the checks of
+    :meth:`check_many` are scattered to all shards and gathered at once.
+    The assertions should be picklable, such as the module-level functions.
+    A resource could not join two trees which belong to different shards.
+
+    Example:
+    >>> with ShardedRegistry(shards=4) as acl:
+    ...     acl.add_role("staff")
+    ...     acl.add_resource("tenant-1")
+    ...     acl.add_resource("tenant-1/article", parents=["tenant-1"])
+    ...     acl.allow("staff", "view", "tenant-1")
+    ...     acl.is_allowed("staff", "view", "tenant-1/article")
+    True
+    """
+
+    def __init__(self, shards=4):
+        self._resources = {}
+        self._owners = {}  # resource -> the index of shard
+        self._shards = []
+        for _ in range(shards):
+            connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard,
+                                              args=(child_connection,))
+            process.daemon = True
+            process.start()
+            child_connection.close()
+            self._shards.append(_Shard(process, connection))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    def close(self):
+        """Stop all shard processes."""
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+    def shard_of(self, resource):
+        """Get the index of the shard which a check of resource goes to."""
+        return self._owners.get(resource, 0)
+
+    def stats(self):
+        """Get the numbers of resources and rules of each shard."""
+        return self._broadcast("_stats")
+
+    def add_role(self, role, parents=[]):
+        self._broadcast("add_role", role, list(parents))
+
+    def add_operation(self, operation, parents=[]):
+        self._broadcast("add_operation", operation, list(parents))
+
+    def add_resource(self, resource, parents=[]):
+        owners = set(self._owners[p] for p in parents if p in self._owners)
+        if resource in self._owners:
+            owners.add(self._owners[resource])
+        if len(owners) > 1:
+            raise ValueError("the resource %r could not join the trees of "
+                             "different shards" % (resource,))
+        if owners:
+            owner = owners.pop()
+        else:
+            # a new tree, placed by a stable digest of its root
+            root = next(iter(self._get_roots(resource, parents)))
+            owner = int(fingerprint(root), 16) % len(self._shards)
+
+        self._shards[owner].call("add_resource", resource, list(parents))
+        existing = self._resources.get(resource, ())
+        self._resources[resource] = existing + tuple(
+            p for p in parents if p not in existing)
+        for p in parents:
+            self._owners.setdefault(p, owner)
+        self._owners[resource] = owner
+
+    def allow(self, role, operation, resource, assertion=None):
+        self._route_rule("allow", role, operation, resource, assertion)
+
+    def deny(self, role, operation, resource, assertion=None):
+        self._route_rule("deny", role, operation, resource, assertion)
+
+    def is_allowed(self, role, operation, resource, **assertion_kwargs):
+        shard = self._shards[self.shard_of(resource)]
+        return shard.call("is_allowed", role, operation, resource,
+                          **assertion_kwargs)
+
+    def is_any_allowed(self, roles, operation, resource, **assertion_kwargs):
+        shard = self._shards[self.shard_of(resource)]
+        return shard.call("is_any_allowed", list(roles), operation, resource,
+                          **assertion_kwargs)
+
+    def check_many(self, checks):
+        """Evaluate many ``(roles, operation, resource)`` checks at once.
+
+        The checks are grouped by shards and evaluated in parallel, and the
+        results are returned in the order of checks.
+        """
+        groups = {}
+        for i, (roles, operation, resource) in enumerate(checks):
+            groups.setdefault(self.shard_of(resource), []).append(
+                (i, (list(roles), operation, resource)))
+        # the shards are always locked in the order of their indexes
+        indexes = sorted(groups)
+        replies = self._scatter("_check_many", [
+            (self._shards[index], ([check for i, check in groups[index]],))
+            for index in indexes])
+        results = [None] * len(checks)
+        for index, reply in zip(indexes, replies):
+            for (i, check), result in zip(groups[index], reply):
+                results[i] = result
+        return results
+
+    def _route_rule(self, method, role, operation, resource, assertion):
+        if resource is None or isinstance(resource, PathPattern):
+            self._broadcast(method, role, operation, resource, assertion)
+        elif resource not in self._owners:
+            raise ValueError("the resource %r is not registered" %
+                             (resource,))
+        else:
+            self._shards[self._owners[resource]].call(
+                method, role, operation, resource, assertion)
+
+    def _broadcast(self, method, *args):
+        return self._scatter(method, [(shard, args)
+                                      for shard in self._shards])
+
+    def _scatter(self, method, messages):
+        # the messages should be in the order of shards, since each shard is
+        # locked until its reply is read, and locking them in different
+        # orders could deadlock. Every shard which has been sent a message
+        # is drained, even if some of them fail, otherwise their replies
+        # would be read by the later calls.
+        sent = []
+        try:
+            for shard, args in messages:
+                shard.send(method, *args)
+                sent.append(shard)
+        finally:
+            replies = [shard.reply() for shard in sent]
+        for succeeded, result in replies:
+            if not succeeded:
+                raise result
+        return [result for succeeded, result in replies]
+
+    def _get_roots(self, resource, parents):
+        roots = []
+        for parent in parents:
+            ancestors = [parent] + list(get_parents(self._resources, parent))
+            roots.extend(a for a in ancestors if not self._resources.get(a))
+        return roots or [resource]
+
+
+class _Shard(object):
+    """The connection to a shard process."""
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.lock = threading.RLock()
+
+    def call(self, method, *args, **kwargs):
+        with self.lock:
+            self.send(method, *args, **kwargs)
+            return self.receive()
+
+    def send(self, method, *args, **kwargs):
+        self.lock.acquire()  # released after receiving the result
+        try:
+            self.connection.send((method, args, kwargs))
+        except Exception:
+            self.lock.release()
+            raise
+
+    def receive(self):
+        succeeded, result = self.reply()
+        if not succeeded:
+            raise result
+        return result
+
+    def reply(self):
+        """Receive the reply as ``(succeeded, result)``."""
+        try:
+            return self.connection.recv()
+        except (EOFError, IOError, OSError) as error:
+            return False, error
+        finally:
+            self.lock.release()
+
+    def close(self):
+        with self.lock:
+            try:
+                self.connection.send(None)
+            except (IOError, OSError):
+                pass
+            self.connection.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+def _serve_shard(connection):
+    acl = Registry()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        method, args, kwargs = message
+        try:
+            if method == "_check_many":
+                result = [acl.is_any_allowed(*check) for check in args[0]]
+            elif method == "_stats":
+                result = {"resources": len(acl._resources),
+                          "rules": len(acl._allowed) + len(acl._denied)}
+            else:
+                result = getattr(acl, method)(*args, **kwargs)
+        except Exception as error:
+            connection.send((False, error))
+        else:
+            connection.send((True, result))
+    connection.close()
@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+import collections
+import threading
+
+from .acl import Registry
+from .overlay import OverlayRegistry
+
+
+__all__ = ["TenantRegistry"]
+
+
+class TenantRegistry(object):
+    """A registry partitioned by tenants.
+
+    All tenants share a base registry of the global roles, resources and
+    rules. Each tenant has its own partition, a overlay of the base registry,
+    so a check only evaluates the partition of its tenant and the base.
+
+    The partitions are created by the `loader`, a callable object which adds
+    the roles, resources and rules of a tenant into a empty partition. Only
+    `maxsize` partitions are kept, and the least recently used ones will be
+    evicted and loaded again while they are used later.
+
+    Example:
+    >>> def load_tenant(tenant, acl):
+    ...     for role, parents in db.query_roles(tenant):
+    ...         acl.add_role(role, parents)
+    >>> tenants = TenantRegistry(base_acl, load_tenant, maxsize=1000)
+    >>> tenants.is_allowed("tenant-42", "staff", "view", "article")
+    """
+
+    def __init__(self, base=None, loader=None, maxsize=1024):
+        self.base = Registry() if base is None else base
+        self.loader = loader
+        self.maxsize = maxsize
+        self._partitions = collections.OrderedDict()
+        self._loading = {}  # tenant -> the lock of loading it
+        self._lock = threading.RLock()
+
+    def __contains__(self, tenant):
+        return tenant in self._partitions
+
+    def __len__(self):
+        return len(self._partitions)
+
+    def tenant(self, tenant):
+        """Get the partition of a tenant, loading it if necessary.
+
+        The loader runs without holding the lock of partitions, so a slow
+        load doesn't block the checks of other tenants. The concurrent loads
+        of one tenant are serialized by a lock of this tenant.
+        """
+        with self._lock:
+            partition = self._touch(tenant)
+            if partition is not None:
+                return partition
+            loading = self._loading.get(tenant)
+            if loading is None:
+                loading = self._loading[tenant] = threading.Lock()
+
+        with loading:
+            with self._lock:
+                partition = self._touch(tenant)
+            if partition is not None:
+                return partition  # loaded by another thread
+
+            partition = OverlayRegistry(self.base)
+            try:
+                if self.loader is not None:
+                    self.loader(tenant, partition)
+            except Exception:
+                with self._lock:
+                    self._loading.pop(tenant, None)
+                raise
+            with self._lock:
+                self._loading.pop(tenant, None)
+                self._partitions[tenant] = partition
+                # the partitions without loader could not be loaded again
+                if self.loader is not None:
+                    while len(self._partitions) > self.maxsize:
+                        self._partitions.popitem(last=False)
+            return partition
+
+    def _touch(self, tenant):
+        # mark the partition as the most recently used
+        partition = self._partitions.pop(tenant, None)
+        if partition is not None:
+            self._partitions[tenant] = partition
+        return partition
+
+    def evict(self, tenant):
+        """Drop the partition of a tenant."""
+        with self._lock:
+            self._partitions.pop(tenant, None)
+
+    def is_allowed(self, tenant, role, operation, resource,
+                   **assertion_kwargs):
+        """Check the permission in the partition of a tenant."""
+        return self.tenant(tenant).is_allowed(role, operation, resource,
+                                              **assertion_kwargs)
+
+    def is_any_allowed(self, tenant, roles, operation, resource,
+                       **assertion_kwargs):
+        """Check the permission with many roles in a tenant."""
+        return self.tenant(tenant).is_any_allowed(roles, operation, resource,
+                                                  **assertion_kwargs)
@@ -16,6 +16,7 @@ setup(
     license='MIT License',
     packages=['rbac'],
     zip_safe=False,
+    extras_require={':python_version < "3"': ['futures']},
     platforms=['Any'],
     classifiers=[
         'Programming Language :: Python',
@@ -0,0 +1,7 @@
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # these modules require the async syntax
+    collect_ignore.extend(["test_loader.py", "test_server.py"])
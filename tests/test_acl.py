@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
+import threading
+import time
+
 import pytest
 
 import rbac.acl
 import rbac.proxy
+from rbac.pattern import PathPattern
 
 
 @pytest.fixture(params=[
@@ -151,5 +155,311 @@ def test_assertion(acl):
     assert acl.is_allowed('manager', 'edit', 'news')
 
 
+def test_pattern_rules(acl):
+    acl.add_resource('/org/42')
+    acl.add_resource('/org/42/doc/1', parents=['/org/42'])
+    acl.allow('actived_user', 'view', PathPattern('/org/*/doc/**'))
+    acl.allow('writer', 'edit', PathPattern('/org/*'))
+    acl.deny('manager', 'view', PathPattern('/org/42/doc/secret'))
+
+    # the concrete resources don't need to be registered
+    assert acl.is_allowed('actived_user', 'view', '/org/7/doc/3')
+    assert acl.is_allowed('editor', 'view', '/org/7/doc')
+    assert not acl.is_allowed('actived_user', 'view', '/org/7')
+    assert not acl.is_allowed('manager', 'view', '/org/42/doc/secret')
+    assert acl.is_any_allowed(['user', 'writer'], 'view', '/org/42/doc/1')
+    assert not acl.is_any_allowed(['user', 'editor'], 'view',
+                                  '/org/42/doc/secret')
+
+    # the patterns matching the parent resources are applied too
+    assert acl.is_allowed('writer', 'edit', '/org/42')
+    assert acl.is_allowed('writer', 'edit', '/org/42/doc/1')
+    assert not acl.is_allowed('writer', 'edit', '/org/7/doc/1')
+
+
 def test_is_any_allowed(acl):
     pass  # TODO: create a test
+
+
+def test_operation_hierarchy(acl):
+    acl.add_operation('read')
+    acl.add_operation('write', parents=['read'])
+    acl.add_operation('admin', parents=['write'])
+    acl.add_operation('comment', parents=['read'])
+
+    acl.allow('actived_user', 'read', 'post')
+    acl.allow('writer', 'write', 'post')
+    acl.allow('manager', 'admin', 'news')
+    acl.deny('editor', 'write', 'event')
+
+    assert acl.is_allowed('actived_user', 'read', 'news')
+    assert not acl.is_allowed('actived_user', 'write', 'news')
+
+    # the implied operations are allowed
+    assert acl.is_allowed('writer', 'read', 'news')
+    assert acl.is_allowed('writer', 'write', 'news')
+    assert not acl.is_allowed('writer', 'admin', 'news')
+    assert acl.is_allowed('manager', 'write', 'event')
+    assert not acl.is_allowed('manager', 'write', 'infor')
+    assert not acl.is_allowed('manager', 'comment', 'news')
+
+    # the implying operations are denied too
+    assert not acl.is_allowed('editor', 'write', 'event')
+    assert not acl.is_allowed('editor', 'admin', 'event')
+    assert acl.is_allowed('editor', 'read', 'event')
+    assert acl.is_allowed('editor', 'write', 'news')
+    acl.deny('actived_user', 'read', 'infor')
+    assert not acl.is_allowed('writer', 'write', 'infor')
+    assert not acl.is_allowed('manager', 'comment', 'infor')
+
+    assert acl.is_any_allowed(['user', 'manager'], 'read', 'event')
+    assert not acl.is_any_allowed(['user', 'editor'], 'admin', 'event')
+    assert not acl.is_any_allowed(['user'], 'write', 'event')
+
+
+def test_assertion_scheduling(acl):
+    calls = []
+
+    def make_assertion(name, result, cost=None, pure=False):
+        def assertion(acl, role, operation, resource, **kwargs):
+            calls.append(name)
+            return result
+        if cost is None and not pure:
+            return assertion
+        return rbac.acl.Assertion(assertion, cost=cost or 0, pure=pure)
+
+    shared = make_assertion('shared', False)
+    acl.allow('actived_user', 'edit', 'news', shared)
+    acl.allow('writer', 'edit', 'post', shared)
+    acl.allow('writer', 'edit', 'news', make_assertion('remote', True, 100))
+    acl.deny('manager', 'edit', 'news', make_assertion('cheap', False, 1))
+
+    # the same assertion is called once in a evaluation, and the cheap
+    # denied rules are evaluated before expensive allowed rules
+    assert acl.is_allowed('editor', 'edit', 'news')
+    assert calls == ['cheap', 'shared', 'remote']
+
+    # the expensive assertion is skipped by a assertion-free denied rule
+    del calls[:]
+    acl.deny('editor', 'edit', 'event')
+    assert not acl.is_allowed('editor', 'edit', 'event')
+    assert calls == []
+
+    # the assertion-free allowed rule skips the allowed assertions
+    acl.allow('manager', 'edit', 'news')
+    assert acl.is_allowed('editor', 'edit', 'news')
+    assert calls == ['cheap']
+
+
+def test_pure_assertion(acl):
+    calls = []
+
+    def is_owner(acl, role, operation, resource, user=None):
+        calls.append(user)
+        return user == 'tom'
+
+    acl.allow('writer', 'edit', 'news', rbac.acl.Assertion(
+        is_owner, pure=True))
+
+    for _ in range(3):
+        assert acl.is_allowed('writer', 'edit', 'news', user='tom')
+        assert not acl.is_allowed('writer', 'edit', 'news', user='jerry')
+    assert calls == ['tom', 'jerry']
+
+    # the unhashable arguments are not cached
+    assert not acl.is_allowed('writer', 'edit', 'news', user=['tom'])
+    assert not acl.is_allowed('writer', 'edit', 'news', user=['tom'])
+    assert calls == ['tom', 'jerry', ['tom'], ['tom']]
+
+
+def test_pure_assertion_per_registry():
+    def is_frozen(acl, role, operation, resource):
+        return getattr(acl, 'frozen', False)
+
+    acl = rbac.acl.Registry()
+    acl.add_role('user')
+    acl.add_resource('post')
+    acl.deny('user', 'edit', 'post', rbac.acl.Assertion(is_frozen, pure=True))
+    acl.allow('user', 'edit', 'post')
+    overlay = acl.overlay()
+    overlay.frozen = True
+
+    # the results of one registry are not reused by another
+    assert acl.is_allowed('user', 'edit', 'post')
+    assert not overlay.is_allowed('user', 'edit', 'post')
+    assert acl.is_allowed('user', 'edit', 'post')
+
+
+def test_rule_prefilter(acl):
+    acl.allow('actived_user', 'view', 'news')
+    acl.deny('manager', 'view', 'event')
+    acl.allow('writer', 'edit', None)
+    acl.deny(None, 'delete', 'post')
+    acl.allow('editor', 'delete', 'comment', lambda *args: True)
+
+    registry = getattr(acl, 'acl', acl)
+    assert registry._allowed_index[0] == set(
+        ['super', 'actived_user', 'writer', 'editor'])
+    assert registry._denied_index[2] == set(['event', 'post'])
+
+    accesses = [(role, operation, resource)
+                for role in registry._roles
+                for operation in ['view', 'edit', 'delete', 'new']
+                for resource in registry._resources]
+    results = [acl.is_allowed(*access) for access in accesses]
+
+    registry.prefilter_rules = False
+    registry._clear_caches()
+    assert results == [acl.is_allowed(*access) for access in accesses]
+
+
+def test_assertion_timeout(acl):
+    released = threading.Event()
+    timings = []
+
+    def slow(acl, role, operation, resource, **kwargs):
+        released.wait(1)
+        return True
+
+    def fast(acl, role, operation, resource, **kwargs):
+        return True
+
+    registry = getattr(acl, 'acl', acl)
+    registry.assertion_timeout = 0.05
+    registry.assertion_hook = lambda *args: timings.append(args)
+    acl.allow('writer', 'edit', 'news', fast)
+    acl.allow('writer', 'edit', 'comment', slow)
+    acl.deny('manager', 'edit', 'infor', slow)
+
+    # the fast assertions are unaffected and reported to the hook
+    assert acl.is_allowed('writer', 'edit', 'news')
+    assert timings[-1][:4] == (fast, 'writer', 'edit', 'news')
+    assert timings[-1][5] is False
+
+    # the overrunning assertions fail closed
+    assert acl.is_allowed('writer', 'edit', 'comment') is False
+    assert timings[-1][0] is slow and timings[-1][5] is True
+    assert timings[-1][4] >= 0.05
+    assert acl.is_allowed('editor', 'edit', 'infor') is False
+
+    registry.timeout_result = None
+    assert acl.is_allowed('writer', 'edit', 'comment') is None
+
+    # the budget of a check is shared by its assertions
+    registry.assertion_timeout = None
+    registry.check_timeout = 0.05
+    started = time.time()
+    assert acl.is_allowed('editor', 'edit', 'comment') is None
+    assert time.time() - started < 0.5
+
+    # and so is the budget of a check over several roles
+    roles = ['author-%d' % index for index in range(5)]
+    acl.add_resource('page')
+    for role in roles:
+        acl.add_role(role)
+        acl.allow(role, 'edit', 'page', slow)
+    started = time.time()
+    assert not acl.is_any_allowed(roles, 'edit', 'page')
+    assert not acl.is_any_allowed(iter(roles), 'edit', 'page')
+    assert time.time() - started < 0.2
+
+    # overlays and snapshots inherit the settings
+    registry.check_timeout = None
+    registry.assertion_timeout = 0.05
+    for derived in (registry.overlay(), registry.snapshot()):
+        del timings[:]
+        assert derived.is_allowed('writer', 'edit', 'comment') is None
+        assert timings[-1][0] is slow and timings[-1][5] is True
+    overlay = registry.overlay()
+    overlay.timeout_result = False
+    assert overlay.is_allowed('writer', 'edit', 'comment') is False
+    assert registry.timeout_result is None
+    del overlay.timeout_result
+    assert overlay.is_allowed('writer', 'edit', 'comment') is None
+    released.set()
+
+
+def test_assertion_pools():
+    released = threading.Event()
+
+    def slow(acl, role, operation, resource, **kwargs):
+        released.wait(1)
+        return True
+
+    def fast(acl, role, operation, resource, **kwargs):
+        return True
+
+    registries = []
+    for assertion in [slow, fast]:
+        acl = rbac.acl.Registry()
+        acl.assertion_timeout = 0.05
+        acl.assertion_workers = 1
+        acl.add_role('user')
+        acl.add_resource('post')
+        acl.allow('user', 'view', 'post', assertion)
+        registries.append(acl)
+    hung, healthy = registries
+
+    # the hung pool of a registry doesn't stall the others
+    assert hung.is_allowed('user', 'view', 'post') is False
+    assert healthy.is_allowed('user', 'view', 'post')
+    assert hung._get_assertion_executor() is not \
+        healthy._get_assertion_executor()
+    assert hung._get_assertion_executor() is \
+        hung.overlay()._get_assertion_executor()
+    released.set()
+
+
+def test_content_hash():
+    def build(reverse=False):
+        acl = rbac.acl.Registry()
+        steps = [
+            lambda: acl.add_role('user'),
+            lambda: acl.add_role('writer', parents=['user']),
+            lambda: acl.add_resource('post'),
+            lambda: acl.add_resource('news', parents=['post']),
+            lambda: acl.add_operation('write', parents=['read']),
+        ]
+        for step in reversed(steps) if reverse else steps:
+            step()
+        rules = [
+            lambda: acl.allow('user', 'read', 'post'),
+            lambda: acl.deny('writer', 'write', 'news'),
+        ]
+        for step in reversed(rules) if reverse else rules:
+            step()
+        return acl
+
+    acl, other = build(), build(reverse=True)
+    assert acl.content_hash == other.content_hash
+    assert acl == other
+    assert not acl != other
+    assert acl.diff(other) == rbac.acl.RegistryDiff(set(), set())
+
+    # the incremental digest equals the digest of all items
+    assert int(acl.content_hash, 16) == sum(
+        int(rbac.acl.fingerprint(item), 16)
+        for item in acl._iter_content()) % (1 << 128)
+
+    # adding the existed items changes nothing
+    other.add_role('writer', parents=['user'])
+    other.allow('user', 'read', 'post')
+    assert acl.content_hash == other.content_hash
+
+    other.add_role('editor', parents=['writer'])
+    other.allow('user', 'read', 'post', assertion=len)
+    assert acl.content_hash != other.content_hash
+    assert acl != other
+
+    diff = acl.diff(other)
+    assert diff.added == {
+        ('role', 'editor'), ('role-parent', 'editor', 'writer'),
+        ('allow', 'user', 'read', 'post', rbac.acl.assertion_name(len))}
+    assert diff.removed == {('allow', 'user', 'read', 'post', None)}
+
+    # the same items with different assertions are not equal
+    acl.add_role('editor', parents=['writer'])
+    acl.allow('user', 'read', 'post', assertion=lambda *args: True)
+    other.allow('user', 'read', 'post', assertion=lambda *args: True)
+    assert acl.content_hash == other.content_hash
+    assert acl != other
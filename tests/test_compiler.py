@@ -0,0 +1,138 @@
+from __future__ import absolute_import
+
+import itertools
+import threading
+
+import pytest
+
+import rbac.acl
+import rbac.compiler
+from rbac.pattern import PathPattern
+
+
+@pytest.fixture
+def acl():
+    acl = rbac.acl.Registry()
+    acl.add_role('user')
+    acl.add_role('writer', parents=['user'])
+    acl.add_role('manager', parents=['user'])
+    acl.add_role('editor', parents=['writer', 'manager'])
+    acl.add_role('super')
+
+    acl.add_resource('post')
+    acl.add_resource('news', parents=['post'])
+    acl.add_resource('event', parents=['news'])
+    acl.add_resource('/doc/1')
+
+    acl.add_operation('write', parents=['read'])
+
+    acl.allow('user', 'read', 'post')
+    acl.allow('writer', 'write', 'news')
+    acl.deny('manager', 'write', 'event')
+    acl.allow('super', None, None)
+    acl.allow('writer', 'edit', PathPattern('/doc/**'))
+    return acl
+
+
+def assert_same_decisions(acl, policy):
+    roles = list(acl._roles) + [None]
+    operations = ['read', 'write', 'edit', 'delete', None]
+    resources = list(acl._resources) + [None]
+    for query in itertools.product(roles, operations, resources):
+        assert policy.is_allowed(*query) == acl.is_allowed(*query), query
+    for role_list in itertools.combinations(roles[:-1], 2):
+        for operation, resource in itertools.product(operations, resources):
+            assert bool(policy.is_any_allowed(
+                role_list, operation, resource)) == bool(
+                acl.is_any_allowed(list(role_list), operation, resource))
+
+
+def test_compile(acl):
+    policy = rbac.compiler.compile_registry(acl)
+    assert not policy.from_cache
+    assert 'def decide(' in policy.source
+    assert_same_decisions(acl, policy)
+
+    # the unregistered resources are delegated to the registry
+    assert policy.is_allowed('editor', 'edit', '/doc/2')
+
+    assert not policy.is_stale
+    acl.deny('editor', 'read', 'news')
+    assert policy.is_stale
+    assert_same_decisions(acl, rbac.compiler.compile_registry(acl))
+
+
+def test_assertions(acl):
+    db = {'owner': 'tom'}
+    calls = []
+
+    def is_owner(acl, role, operation, resource, user=None):
+        calls.append(role)
+        return db['owner'] == user
+
+    def is_locked(acl, role, operation, resource, user=None):
+        return db.get('locked', False)
+
+    acl.allow('user', 'comment', 'post', is_owner)
+    acl.allow('manager', 'comment', 'news', is_owner)
+    acl.deny('user', 'comment', 'event', is_locked)
+    policy = rbac.compiler.compile_registry(acl)
+
+    assert policy.is_allowed('editor', 'comment', 'news', user='tom')
+    assert calls == ['editor']
+    assert not policy.is_allowed('editor', 'comment', 'news', user='jerry')
+    assert policy.is_allowed('user', 'comment', 'event', user='tom')
+    db['locked'] = True
+    assert not policy.is_allowed('user', 'comment', 'event', user='tom')
+    assert policy.is_allowed('user', 'comment', 'news', user='tom')
+
+
+def test_assertion_timeout(acl):
+    released = threading.Event()
+
+    def slow(acl, role, operation, resource, **kwargs):
+        released.wait(1)
+        return True
+
+    acl.allow('user', 'comment', 'post', slow)
+    acl.assertion_timeout = 0.05
+    policy = rbac.compiler.compile_registry(acl)
+    assert policy.is_allowed('editor', 'comment', 'news') is False
+    acl.timeout_result = None
+    assert policy.is_allowed('editor', 'comment', 'news') is None
+    released.set()
+
+
+def test_disk_cache(acl, tmpdir):
+    cache_dir = str(tmpdir)
+    policy = rbac.compiler.compile_registry(acl, cache_dir=cache_dir)
+    assert not policy.from_cache
+    assert len(tmpdir.listdir()) == 1
+
+    # the same content, added in another order, reuses the compiled code
+    other = rbac.acl.Registry()
+    other.add_resource('/doc/1')
+    other.add_resource('post')
+    other.add_resource('news', parents=['post'])
+    other.add_resource('event', parents=['news'])
+    other.add_operation('write', parents=['read'])
+    for role, parents in [('super', []), ('user', []),
+                          ('manager', ['user']), ('writer', ['user']),
+                          ('editor', ['manager', 'writer'])]:
+        other.add_role(role, parents)
+    other.allow('writer', 'edit', PathPattern('/doc/**'))
+    other.allow('super', None, None)
+    other.deny('manager', 'write', 'event')
+    other.allow('writer', 'write', 'news')
+    other.allow('user', 'read', 'post')
+    assert other.content_hash == policy.content_hash
+
+    cached = rbac.compiler.compile_registry(other, cache_dir=cache_dir)
+    assert cached.from_cache
+    assert_same_decisions(other, cached)
+
+    other.allow('user', 'read', 'event')
+    changed = rbac.compiler.compile_registry(other, cache_dir=cache_dir)
+    assert not changed.from_cache
+    assert changed.content_hash != policy.content_hash
+    assert len(tmpdir.listdir()) == 2
@@ -148,3 +148,94 @@ def test_nonzero(acl, context, role_provider):
     for _ in role_provider.to_be_badguy():
         assert not bool(check_view)
         assert not bool(check_edit)
+
+
+def test_lazy_roles(acl, context):
+    pulled = []
+
+    def load_roles():
+        for role in ['staff', 'badguy', 'editor']:
+            pulled.append(role)
+            yield role
+
+    context.set_roles_loader(load_roles)
+
+    # stop pulling roles once the access is denied
+    assert not context.has_permission('view', 'article')
+    assert pulled == ['staff', 'badguy']
+
+    acl.add_role('guest')
+    context.set_roles_loader(lambda: iter(['guest', 'staff', 'editor']))
+    assert context.has_permission('edit', 'article')
+    assert not context.has_permission('delete', 'article')
+
+    context.set_roles_loader(lambda: iter(['staff', 'editor', 'staff']))
+    with pytest.raises(AssertionError):
+        context.has_permission('edit', 'article')
+
+
+def test_permission_guard(acl, context, role_provider):
+    @context.permission_guard('view', 'article')
+    def view_article():
+        return True
+
+    @context.permission_guard('edit', 'article')
+    def edit_article():
+        return True
+
+    role_provider.assert_call(view_article, edit_article)
+
+    check_view = context.permission_guard('view', 'article').check
+    check_edit = context.permission_guard('edit', 'article').check
+    role_provider.assert_call(check_view, check_edit)
+
+    for _ in role_provider.to_be_badguy():
+        assert not context.permission_guard('view', 'article')
+
+
+def test_permission_guard_exception(acl, context):
+    class CustomDenied(Exception):
+        def __init__(self, message):
+            super(CustomDenied, self).__init__(message)
+
+    context.set_roles_loader(lambda: ['badguy'])
+
+    @context.permission_guard('view', 'article', exception=CustomDenied,
+                              message='go away')
+    def view_article():
+        return True
+
+    with pytest.raises(CustomDenied) as error:
+        view_article()
+    assert str(error.value) == 'go away'
+
+
+def test_permission_guard_threads(acl, context):
+    import threading
+
+    local = threading.local()
+    context.set_roles_loader(lambda: [local.role])
+
+    @context.permission_guard('edit', 'article')
+    def edit_article():
+        return True
+
+    errors = []
+
+    def run(role, expected):
+        local.role = role
+        for _ in range(200):
+            try:
+                allowed = edit_article()
+            except rbac.context.PermissionDenied:
+                allowed = False
+            if allowed != expected:
+                errors.append(role)
+
+    threads = [threading.Thread(target=run, args=args) for args in
+               [('editor', True), ('staff', False)] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+
+import warnings
+
+import pytest
+
+import rbac.acl
+from rbac.diagnostics import CostWarning, FamilyStats
+
+
+@pytest.fixture
+def acl():
+    acl = rbac.acl.Registry()
+    acl.add_role('user')
+    acl.add_role('writer', parents=['user'])
+    acl.add_role('manager', parents=['user'])
+    acl.add_role('editor', parents=['writer', 'manager'])
+
+    acl.add_resource('post')
+    acl.add_resource('news', parents=['post'])
+    acl.add_operation('write', parents=['read'])
+    return acl
+
+
+def test_analyze(acl):
+    report = acl.analyze()
+    assert report.roles['user'] == FamilyStats(2, 2)
+    assert report.roles['writer'] == FamilyStats(3, 3)
+    assert report.roles['editor'] == FamilyStats(5, 6)
+    assert report.resources['news'] == FamilyStats(3, 3)
+    assert report.operations['write'] == FamilyStats(3, 3)
+    assert report.cycles == []
+    assert report.duplicate_paths == {'editor': 1}
+    assert report.worst_case == 5 * 2 * 3 * 3
+    assert 'worst_case=90' in repr(report)
+
+
+def test_cycles(acl):
+    acl.add_role('user', parents=['editor'])
+    acl.add_role('guest', parents=['writer'])
+    acl.add_role('root')
+    report = acl.analyze()
+
+    assert len(report.cycles) == 2
+    for cycle in report.cycles:
+        assert set(cycle) in (
+            {'user', 'editor', 'writer'}, {'user', 'editor', 'manager'})
+    assert report.roles['guest'] == FamilyStats(None, None)
+    assert report.roles['root'] == FamilyStats(2, 2)
+    assert report.worst_case is None
+
+
+def test_cost_warning(acl):
+    acl.cost_threshold = 120
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        acl.add_role('chief', parents=['editor'])
+        assert caught == []
+
+        acl.add_resource('event', parents=['news'])
+        assert len(caught) == 1
+        assert issubclass(caught[0].category, CostWarning)
+        assert 'event' in str(caught[0].message)
+
+        acl.add_role('user', parents=['chief'])
+        assert len(caught) == 2
+        assert 'cycle' in str(caught[1].message)
+
+
+def test_cost_warning_of_descendants(acl):
+    acl.cost_threshold = 100
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        acl.add_resource('archive')
+        acl.add_operation('read')
+        assert caught == []
+
+        # the family of the child 'news' grows with its parent
+        acl.add_resource('post', parents=['archive'])
+        assert len(caught) == 1
+        assert acl.analyze().worst_case == 120
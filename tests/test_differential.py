@@ -0,0 +1,41 @@
+from __future__ import absolute_import
+
+from rbac.acl import Registry
+from rbac.differential import (ENGINES, RegistrySpec, reference_is_allowed,
+                               run)
+
+
+def test_engines_match_reference():
+    report = run(range(30))
+    assert report.seeds == 30
+    assert set(report.timings) == set(ENGINES) | set(["reference"])
+    assert report.counterexamples == [], report.format()
+
+
+def test_counterexample_is_shrunk():
+    class IgnoringDenials(Registry):
+        def deny(self, role, operation, resource, assertion=None):
+            pass
+
+    def broken(spec):
+        return spec.build(IgnoringDenials())
+
+    report = run(range(30), engines={"broken": broken})
+    assert report.counterexamples
+    for counterexample in report.counterexamples:
+        # only one denied rule is needed to reproduce it
+        assert [rule[0] for rule in counterexample.spec.rules] == ["deny"]
+        assert counterexample.expected is False
+        assert "# broken: " in counterexample.format()
+
+
+def test_later_rule_replaces_earlier_one():
+    spec = RegistrySpec([('r0', [])], [('x0', [])], [('o0', [])], [
+        ('allow', 'r0', 'o0', 'x0', ('false', 0, False)),
+        ('allow', 'r0', 'o0', 'x0', None),
+        ('deny', 'r0', None, 'x0', None),
+        ('deny', 'r0', None, 'x0', ('flag', 1, False)),
+    ])
+    assert reference_is_allowed(spec, 'r0', 'o0', 'x0') is True
+    assert reference_is_allowed(spec, 'r0', 'o0', 'x0', flag=True) is False
+    assert run(range(120, 130)).counterexamples == []
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+
+import asyncio
+import gc
+
+import pytest
+
+from rbac.acl import Registry
+from rbac.context import IdentityContext
+from rbac.loader import BatchRolesLoader
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def batches():
+    return []
+
+
+@pytest.fixture
+def loader(batches):
+    async def load_user_roles(user_ids):
+        batches.append(list(user_ids))
+        await asyncio.sleep(0)
+        if "broken" in user_ids:
+            raise RuntimeError("database is gone")
+        return dict((user_id, ["staff"] if user_id.startswith("s") else [])
+                    for user_id in user_ids)
+    return BatchRolesLoader(load_user_roles, max_batch_size=3)
+
+
+def test_batching(loader, batches):
+    async def scenario():
+        roles = await asyncio.gather(*[
+            loader.load(user_id)
+            for user_id in ["s1", "g1", "s2", "s1", "g2"]])
+        cached = await loader.load_many(["s1", "s2"])
+        return roles, cached
+
+    roles, cached = run(scenario())
+    assert roles == [("staff",), (), ("staff",), ("staff",), ()]
+    assert cached == [("staff",), ("staff",)]
+    # one round trip per batch, and the repeated keys are loaded once
+    assert batches == [["s1", "g1", "s2"], ["g2"]]
+
+
+def test_failure_is_not_cached(loader, batches):
+    async def load_again(user_ids):
+        return [["staff"] for _ in user_ids]
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await asyncio.gather(loader.load("broken"), loader.load("s1"))
+        loader.bulk_loader = load_again
+        return await loader.load_many(["s1", "broken"])
+
+    assert run(scenario()) == [("staff",), ("staff",)]
+
+
+def test_identity_context(loader):
+    acl = Registry()
+    acl.add_role("staff")
+    acl.add_resource("article")
+    acl.allow("staff", "view", "article")
+
+    current_user = {"id": "s1"}
+    context = IdentityContext(acl, loader.roles_loader(
+        lambda: current_user["id"]))
+
+    async def scenario():
+        with pytest.raises(LookupError):
+            context.has_permission("view", "article")
+        await loader.load(current_user["id"])
+        allowed = context.has_permission("view", "article")
+
+        loader.prime("g1", [])
+        current_user["id"] = "g1"
+        return allowed, context.has_permission("view", "article")
+
+    assert run(scenario()) == (True, False)
+
+    # the cache belongs to the event loop
+    async def other_loop():
+        with pytest.raises(LookupError):
+            context.has_permission("view", "article")
+    run(other_loop())
+
+
+def test_closed_loops_are_released(loader):
+    for _ in range(5):
+        run(loader.load_many(["s1", "g1"]))
+    gc.collect()
+    assert len(loader._states) == 0
+
+
+def test_expiration(batches):
+    async def load_user_roles(user_ids):
+        batches.append(list(user_ids))
+        return [["staff"] for _ in user_ids]
+
+    async def scenario():
+        loader = BatchRolesLoader(load_user_roles, ttl=0.05, maxsize=2)
+        await loader.load_many(["s1", "s2", "s3"])
+        await loader.load_many(["s2", "s3"])
+        await loader.load("s1")  # evicted by the newer keys
+        await asyncio.sleep(0.1)
+        await loader.load("s3")  # expired
+
+    run(scenario())
+    assert batches == [["s1", "s2", "s3"], ["s1"], ["s3"]]
@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+
+import io
+import json
+import sys
+
+from rbac.acl import Registry
+from rbac.materialized import MaterializedView
+from rbac.pattern import PathPattern
+
+
+def build(acl):
+    acl.add_role("staff")
+    acl.add_role("editor", parents=["staff"])
+    acl.add_role("guest")
+    acl.add_resource("site")
+    acl.add_resource("article", parents=["site"])
+    acl.add_resource("docs/intro")
+    acl.add_operation("edit", parents=["view"])
+    acl.allow("staff", "view", "site")
+    acl.allow("editor", "edit", "article")
+    acl.deny("guest", "view", None)
+    acl.allow("staff", "review", "article",
+              lambda acl, role, operation, resource: True)
+
+
+def expected_table(acl):
+    view = MaterializedView(Registry())
+    view.acl = acl
+    view.rebuild()
+    return dict(view._table)
+
+
+def test_table():
+    view = MaterializedView(Registry())
+    build(view)
+    assert view.is_allowed("editor", "view", "article") is True
+    assert view.is_allowed("editor", "edit", "site") is None
+    assert view.is_allowed("guest", "edit", "site") is False
+    assert ("guest", "edit", "site") in view
+    assert ("staff", "review", "article") in view._conditional
+    assert view.is_allowed("editor", "review", "article") is True
+    assert view._table == expected_table(view.acl)
+
+
+def test_incremental_updates():
+    view = MaterializedView(Registry())
+    build(view)
+
+    updated = []
+    update = view._update
+
+    def counted_update(roles, operations, resources):
+        updated.append(len(roles) * len(operations) * len(resources))
+        update(roles, operations, resources)
+    view._update = counted_update
+
+    view.add_role("chief", parents=["editor"])
+    view.deny("editor", "edit", "article")
+    view.allow("staff", "publish", PathPattern("docs/*"))
+    view.add_resource("docs/intro", parents=["site"])
+    assert view._table == expected_table(view.acl)
+    assert view.is_allowed("chief", "view", "article") is True
+    assert view.is_allowed("chief", "edit", "article") is False
+    assert view.is_allowed("staff", "publish", "docs/intro") is True
+
+    # only the descendant roles and resources are updated
+    assert updated[:2] == [1 * 3 * 3, 2 * 1 * 1]
+
+    # the changes made to the registry directly cause a rebuild
+    view.acl.allow("guest", "edit", "docs/intro")
+    assert view.is_allowed("guest", "edit", "docs/intro") is False
+    assert view._table == expected_table(view.acl)
+
+
+def test_streaming():
+    view = MaterializedView(Registry())
+    build(view)
+    chunks = list(view.iter_rows(chunk_size=4))
+    assert all(len(chunk) <= 4 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == len(view)
+
+    report = io.StringIO()
+    view.write_jsonl(report, chunk_size=4)
+    rows = [json.loads(line) for line in report.getvalue().splitlines()]
+    assert len(rows) == len(view)
+    assert {"role": "guest", "operation": "edit", "resource": "site",
+            "allowed": False} in rows
+
+    report = io.BytesIO() if sys.version_info[0] == 2 else io.StringIO()
+    view.write_csv(report)
+    lines = report.getvalue().splitlines()
+    assert lines[0] == "role,operation,resource,allowed"
+    assert "editor,edit,article,True" in lines
@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+
+import threading
+
+from rbac.acl import Registry
+from rbac.metrics import Metrics, MeteredIdentityContext, MeteredRegistry
+
+
+def build():
+    acl = Registry()
+    acl.add_role("staff")
+    acl.add_role("guest")
+    acl.add_resource("article")
+    acl.allow("staff", "view", "article")
+    acl.deny("guest", "edit", "article")
+    return acl
+
+
+def test_counters():
+    metrics = Metrics(buckets=[0.001, 1.0])
+    acl = MeteredRegistry(build(), metrics)
+    context = MeteredIdentityContext(acl, metrics, lambda: ["staff"])
+
+    assert acl.is_allowed("staff", "view", "article") is True
+    assert acl.is_allowed("guest", "edit", "article") is False
+    assert acl.is_allowed("guest", "view", "article") is None
+    assert context.has_permission("view", "article")
+
+    def check_in_thread():
+        for _ in range(10):
+            acl.is_allowed("staff", "view", "article")
+    threads = [threading.Thread(target=check_in_thread) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = metrics.collect()
+    assert sum(totals["is_allowed", "view", "allow"][:-1]) == 41
+    assert sum(totals["is_allowed", "edit", "deny"][:-1]) == 1
+    assert sum(totals["is_allowed", "view", "no-rule"][:-1]) == 1
+    assert sum(totals["is_any_allowed", "view", "allow"][:-1]) == 1
+    assert sum(totals["context", "view", "allow"][:-1]) == 1
+
+
+def test_expose():
+    metrics = Metrics(buckets=[0.5, 1.0])
+    metrics.observe("is_allowed", 'say "hi"', "allow", 0.25)
+    metrics.observe("is_allowed", 'say "hi"', "allow", 0.75)
+    metrics.observe("is_allowed", 'say "hi"', "allow", 2.0)
+
+    labels = 'method="is_allowed",operation="say \\"hi\\"",decision="allow"'
+    lines = metrics.expose().splitlines()
+    assert "# TYPE rbac_checks_total counter" in lines
+    assert "# TYPE rbac_check_duration_seconds histogram" in lines
+    assert "rbac_checks_total{%s} 3" % labels in lines
+    assert lines[-5:] == [
+        'rbac_check_duration_seconds_bucket{%s,le="0.5"} 1' % labels,
+        'rbac_check_duration_seconds_bucket{%s,le="1.0"} 2' % labels,
+        'rbac_check_duration_seconds_bucket{%s,le="+Inf"} 3' % labels,
+        'rbac_check_duration_seconds_sum{%s} 3.0' % labels,
+        'rbac_check_duration_seconds_count{%s} 3' % labels]
@@ -72,9 +72,73 @@ def test_short_circuit_skip_deny(acl, context, evaluated_roles):
     acl.allow('scientist', 'study', 'the dinosaurs')
     context.has_permission('feed', 'the dinosaurs')
 
-    # since scientist is no longer deny-only,
-    # only the intern check will be skipped
-    assert evaluated_roles == ['tourist', 'scientist']
+    # scientist is no longer deny-only, but still could not grant feeding
+    assert evaluated_roles == []
+
+    acl.allow('scientist', 'feed', 'the dinosaurs')
+    assert not context.has_permission('feed', 'the dinosaurs')
+
+    # since scientist could grant feeding now, all roles are checked and
+    # the intern is still denied
+    assert evaluated_roles == ['tourist', 'scientist', 'intern']
+
+
+def test_short_circuit_skip_irrelevant(acl, context, evaluated_roles):
+    """Roles which could not grant the access are only checked for denial."""
+    acl.add_resource('park')
+    acl.add_resource('paddock', parents=['park'])
+    acl.add_role('visitor')
+    acl.add_role('keeper')
+    acl.add_role('vet', parents=['keeper'])
+    acl.allow('visitor', 'view', 'park')
+    acl.allow('keeper', 'feed', 'park')
+    acl.deny('visitor', 'feed', 'paddock')
+
+    setattr(acl, 'is_allowed', _FunctionProxy(acl.is_allowed, evaluated_roles))
+    context.set_roles_loader(lambda: ['visitor', 'vet'])
+
+    # vet inherits feeding from keeper, visitor is checked for denial only
+    assert not context.has_permission('feed', 'paddock')
+    assert evaluated_roles == ['visitor']
+
+    del evaluated_roles[:]
+    assert context.has_permission('feed', 'park')
+    assert evaluated_roles == ['visitor', 'vet']
+
+    # nobody could grant milking, so nothing is checked
+    del evaluated_roles[:]
+    assert not context.has_permission('milk', 'paddock')
+    assert evaluated_roles == []
+
+
+def test_rule_of_all_roles_is_not_skipped(acl, context):
+    """The rules of None role make every role able to grant the access."""
+    acl.add_resource('park')
+    acl.add_role('tourist')
+    acl.allow(None, 'view', 'park')
+    acl.add_role('guide')
+    context.set_roles_loader(lambda: ['tourist', 'guide'])
+    assert context.has_permission('view', 'park')
+    assert acl.is_any_allowed(['tourist'], 'view', 'park')
+    assert acl.is_any_allowed(['guide'], 'view', 'park')
+
+
+def test_readded_role_is_not_skipped(acl, context):
+    """Adding a role again keeps the grants of it and of its new parents."""
+    acl.add_resource('park')
+    acl.add_role('tourist')
+    acl.add_role('guide')
+    acl.add_role('ranger')
+    acl.allow('tourist', 'view', 'park')
+    acl.allow('guide', 'lead', 'park')
+    acl.add_role('tourist')
+    acl.add_role('ranger', parents=['guide'])
+    for role, operation in [('tourist', 'view'), ('ranger', 'lead')]:
+        context.set_roles_loader(lambda: iter([role]))
+        assert acl.is_allowed(role, operation, 'park')
+        assert acl.is_any_allowed([role], operation, 'park')
+        assert acl.is_any_allowed(iter([role]), operation, 'park')
+        assert context.has_permission(operation, 'park')
 
 
 def test_short_circuit_skip_allow(acl, context, evaluated_roles):
@@ -93,3 +157,39 @@ def test_short_circuit_skip_allow(acl, context, evaluated_roles):
 
     # since role '3' was allowed, 'allowed' isn't checked on any role
     assert evaluated_roles == roles[0:4]
+
+
+def test_assertion_evaluation_order(acl):
+    """Denials first, then the nearest ancestors first and cheaper first."""
+    evaluated = []
+
+    def make_assertion(name, cost=0):
+        def assertion(*args, **kwargs):
+            evaluated.append(name)
+            return False
+        return rbac.acl.Assertion(assertion, cost=cost)
+
+    acl.add_resource('site')
+    acl.add_resource('page', parents=['site'])
+    acl.add_role('zz-base')
+    acl.add_role('mm-staff', parents=['zz-base'])
+    acl.add_role('aa-editor', parents=['mm-staff'])
+
+    acl.allow('zz-base', 'edit', 'page', make_assertion('base'))
+    acl.allow('aa-editor', 'edit', 'site', make_assertion('editor-site'))
+    acl.allow('aa-editor', 'edit', 'page', make_assertion('editor-page'))
+    acl.allow('mm-staff', 'edit', None, make_assertion('staff-any'))
+    acl.allow('mm-staff', 'edit', 'page', make_assertion('staff', cost=5))
+    acl.deny('zz-base', 'edit', 'site', make_assertion('denial', cost=9))
+
+    assert acl.is_allowed('aa-editor', 'edit', 'page') is None
+    assert evaluated == ['denial', 'editor-page', 'editor-site',
+                         'staff-any', 'base', 'staff']
+
+    # the plan is cached and rebuilt after changes
+    assert ('aa-editor', 'edit', 'page') in acl._plans
+    acl.allow('aa-editor', 'edit', None, make_assertion('editor-any'))
+    del evaluated[:]
+    assert acl.is_allowed('aa-editor', 'edit', 'page') is None
+    assert evaluated == ['denial', 'editor-page', 'editor-site',
+                         'editor-any', 'staff-any', 'base', 'staff']
@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+
+import pytest
+
+import rbac.acl
+import rbac.overlay
+from rbac.pattern import PathPattern
+
+
+@pytest.fixture
+def acl():
+    acl = rbac.acl.Registry()
+    acl.add_role('staff')
+    acl.add_role('editor', parents=['staff'])
+    acl.add_role('guest')
+    acl.add_resource('article')
+    acl.add_resource('draft', parents=['article'])
+
+    acl.allow('staff', 'view', 'article')
+    acl.allow('editor', 'edit', 'article')
+    acl.deny('guest', 'edit', None)
+    return acl
+
+
+def test_temporary_deny(acl):
+    overlay = acl.overlay()
+    assert isinstance(overlay, rbac.overlay.OverlayRegistry)
+    assert overlay.parent is acl
+
+    overlay.deny('editor', 'edit', 'draft')
+    assert not overlay.is_allowed('editor', 'edit', 'draft')
+    assert overlay.is_allowed('editor', 'edit', 'article')
+    assert not overlay.is_any_allowed(['staff', 'editor'], 'edit', 'draft')
+
+    # the parent is untouched
+    assert acl.is_allowed('editor', 'edit', 'draft')
+    assert ('editor', 'edit', 'draft') not in acl._denied
+
+
+def test_local_additions(acl):
+    overlay = rbac.overlay.OverlayRegistry(acl)
+    overlay.add_role('writer', parents=['staff'])
+    overlay.add_role('guest', parents=['staff'])
+    overlay.add_resource('news', parents=['article'])
+    overlay.add_operation('publish', parents=['edit'])
+    overlay.allow('writer', 'publish', PathPattern('/news/**'))
+    overlay.allow('guest', 'comment', 'news')
+
+    assert overlay.is_allowed('writer', 'view', 'news')
+    assert overlay.is_allowed('writer', 'edit', '/news/1')
+    assert overlay.is_allowed('guest', 'view', 'news')
+    assert not overlay.is_allowed('guest', 'edit', 'news')
+    assert overlay.is_any_allowed(['guest'], 'comment', 'news')
+    assert 'writer' in overlay._roles and 'writer' not in acl._roles
+    assert acl._roles['guest'] == ()
+    assert 'guest' in acl._denial_only_roles
+    assert 'guest' not in overlay._denial_only_roles
+
+
+def test_parent_changes(acl):
+    overlay = acl.overlay()
+    assert not overlay.is_any_allowed(['staff'], 'delete', 'article')
+
+    acl.allow('staff', 'delete', 'article')
+    assert overlay.is_any_allowed(['staff'], 'delete', 'article')
+
+    # the local roles inherit the later allowed rules of the parent
+    overlay.add_role('intern', parents=['guest'])
+    overlay.add_role('guest', parents=['staff'])
+    overlay.add_role('visitor')
+    acl.allow('staff', 'publish', 'article')
+    assert overlay.is_any_allowed(['guest'], 'publish', 'article')
+    assert overlay.is_any_allowed(['intern'], 'publish', 'article')
+    assert not overlay.is_any_allowed(['visitor'], 'publish', 'article')
+    acl.allow(None, 'comment', 'article')
+    assert overlay.is_any_allowed(['visitor'], 'comment', 'article')
+
+    stacked = overlay.overlay()
+    acl.allow(None, 'share', 'draft')
+    assert stacked.is_any_allowed(['visitor'], 'share', 'draft')
+
+
+def test_snapshot(acl):
+    snapshot = acl.snapshot()
+    overlay = snapshot.overlay()
+    acl.deny('staff', 'view', 'draft')
+
+    assert not acl.is_allowed('staff', 'view', 'draft')
+    assert snapshot.is_allowed('staff', 'view', 'draft')
+    assert overlay.is_allowed('staff', 'view', 'draft')
+
+    with pytest.raises(TypeError):
+        snapshot.allow('guest', 'view', 'article')
+
+
+def test_stacked_overlays(acl):
+    first = acl.overlay()
+    first.add_role('writer', parents=['staff'])
+    first.allow('writer', 'edit', 'draft')
+    second = first.overlay()
+    second.deny('writer', 'edit', 'draft')
+
+    assert first.is_allowed('writer', 'edit', 'draft')
+    assert not second.is_allowed('writer', 'edit', 'draft')
+    assert second.is_allowed('writer', 'view', 'draft')
+
+    snapshot = second.snapshot()
+    assert not snapshot.is_allowed('writer', 'edit', 'draft')
+    assert snapshot.is_allowed('writer', 'view', 'draft')
+    assert snapshot.is_allowed('editor', 'edit', 'draft')
+
+
+def test_content_hash(acl):
+    overlay = acl.overlay()
+    assert overlay.content_hash == acl.content_hash
+    assert overlay == acl
+
+    overlay.add_role('guest', parents=['staff'])
+    overlay.allow('guest', 'comment', 'article')
+    overlay.deny('guest', 'edit', None)  # the same rule as the parent
+    assert overlay.content_hash != acl.content_hash
+    assert overlay.content_hash == overlay.snapshot().content_hash
+    assert overlay == overlay.snapshot()
+
+    other = acl.snapshot().overlay()
+    other.allow('guest', 'comment', 'article')
+    other.add_role('guest', parents=['staff'])
+    assert overlay.content_hash == other.content_hash
+    assert overlay == other
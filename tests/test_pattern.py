@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+import pytest
+
+from rbac.pattern import PathPattern, PatternIndex
+
+
+def test_path_pattern():
+    assert PathPattern('/org/*/doc').match('/org/42/doc')
+    assert not PathPattern('/org/*/doc').match('/org/42/doc/9')
+    assert not PathPattern('/org/*/doc').match('/org/42')
+    assert PathPattern('/org/42/**').match('/org/42')
+    assert PathPattern('/org/42/**').match('/org/42/project/7')
+    assert not PathPattern('/org/42/**').match('/org/43/project/7')
+    assert not PathPattern('/org/**').match(42)
+
+    assert PathPattern('/org/**') == PathPattern('/org/**')
+    assert PathPattern('/org/**') != PathPattern('/org/*')
+    assert hash(PathPattern('/org/**')) == hash(PathPattern('/org/**'))
+
+    with pytest.raises(ValueError):
+        PathPattern('/org/**/doc')
+
+
+def test_pattern_index():
+    patterns = [PathPattern(p) for p in (
+        '/org/**', '/org/*/project/**', '/org/42/project/*', '/org/*/doc',
+        '/user/*')]
+    index = PatternIndex(patterns)
+    assert len(index) == 5
+
+    def match(path):
+        return set(p.pattern for p in index.match(path))
+
+    assert match('/org/42/project/7') == {
+        '/org/*/project/**', '/org/**', '/org/42/project/*'}
+    assert match('/org/1/doc') == {'/org/*/doc', '/org/**'}
+    assert match('/user/tom') == {'/user/*'}
+    assert match('/user/tom/avatar') == set()
+    assert match('/nothing') == set()
+    assert match(None) == set()
+
+    for path in ['/org/42/project/7', '/org/1/doc', '/user/tom', '/x/y']:
+        assert set(index.match(path)) == set(
+            p for p in patterns if p.match(path))
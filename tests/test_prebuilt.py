@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+
+import io
+import runpy
+
+import pytest
+
+import rbac.acl
+import rbac.prebuilt
+from rbac.pattern import PathPattern
+
+
+def never(*args, **kwargs):
+    return False
+
+
+@pytest.fixture
+def acl():
+    acl = rbac.acl.Registry()
+    acl.add_role('staff')
+    acl.add_role('editor', parents=['staff'])
+    acl.add_role('badguy', parents=['staff'])
+    acl.add_resource('article')
+    acl.add_resource('draft', parents=['article'])
+    acl.add_operation('edit', parents=['view'])
+
+    acl.allow('staff', 'view', 'article')
+    acl.allow('editor', 'edit', 'article')
+    acl.deny('badguy', None, 'draft')
+    return acl
+
+
+def assert_same(acl, loaded, equal=True):
+    assert (loaded == acl) is equal
+    assert loaded.content_hash == acl.content_hash
+    for role in ['staff', 'editor', 'badguy']:
+        for operation in ['view', 'edit', None]:
+            for resource in ['article', 'draft', None]:
+                assert loaded.is_allowed(role, operation, resource) == \
+                    acl.is_allowed(role, operation, resource)
+        assert loaded.is_any_allowed([role], 'edit', 'draft') == \
+            acl.is_any_allowed([role], 'edit', 'draft')
+
+
+def test_marshal(acl):
+    data = rbac.prebuilt.dumps(acl)
+    assert data.startswith(b'M')
+    assert_same(acl, rbac.prebuilt.loads(data))
+
+    fp = io.BytesIO()
+    rbac.prebuilt.dump(acl, fp)
+    fp.seek(0)
+    loaded = rbac.prebuilt.load(fp)
+    assert_same(acl, loaded)
+
+    # the loaded registry could be changed
+    loaded.allow('badguy', 'view', 'article')
+    assert loaded.is_allowed('badguy', 'view', 'article')
+
+
+def test_pickle(acl):
+    acl.allow('staff', 'view', PathPattern('/doc/**'))
+    acl.deny('editor', 'edit', 'draft', rbac.acl.Assertion(never, cost=2))
+    data = rbac.prebuilt.dumps(acl)
+    assert data.startswith(b'P')
+
+    loaded = rbac.prebuilt.loads(data)
+    assert loaded.content_hash == acl.content_hash
+    assert loaded.is_allowed('editor', 'view', '/doc/1')
+    # the assertions are copied, so the registries are not equal
+    assert_same(acl.overlay(), rbac.prebuilt.loads(
+        rbac.prebuilt.dumps(acl.overlay())), equal=False)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        rbac.prebuilt.loads(b'X')
+
+
+def test_write_module(acl, tmpdir):
+    path = str(tmpdir.join('prebuilt_acl.py'))
+    rbac.prebuilt.write_module(acl, path)
+    assert_same(acl, runpy.run_path(path)['registry'])
@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+
+import io
+import os
+
+from rbac.acl import Registry
+from rbac.context import IdentityContext
+from rbac.prebuilt import dump
+from rbac.replay import (DecisionRecorder, RecordingRegistry, read_log,
+                         replay, replay_files)
+
+
+def build(deny_guest=True):
+    acl = Registry()
+    acl.add_role("staff")
+    acl.add_role("guest")
+    acl.add_resource(("site", 1))
+    acl.add_resource("article", parents=[("site", 1)])
+    acl.allow("staff", "view", ("site", 1))
+    acl.allow("guest", "view", "article")
+    if deny_guest:
+        acl.deny("guest", "view", ("site", 1))
+    return acl
+
+
+def record(acl, log, sample_rate=1.0):
+    recorder = DecisionRecorder(log, sample_rate, buffer_size=2)
+    proxy = RecordingRegistry(acl, recorder)
+    context = IdentityContext(proxy)
+    for roles in [["staff"], ["guest"], ["staff", "guest"]]:
+        context.set_roles_loader(lambda: iter(roles))
+        for resource in ["article", ("site", 1)]:
+            context.has_permission("view", resource)
+    proxy.is_any_allowed(["staff"], "edit", "article")
+    assert proxy.is_allowed("staff", "view", "article")  # not recorded
+    recorder.flush()
+
+
+def test_recording():
+    log = io.StringIO()
+    record(build(), log)
+    records = list(read_log(io.StringIO(log.getvalue())))
+    assert len(records) == 7
+    assert records[1][:4] == [["staff"], "view", ("site", 1), True]
+    assert records[3][:4] == [["guest"], "view", ("site", 1), False]
+    assert all(latency >= 0 for latency in (r[4] for r in records))
+
+    log = io.StringIO()
+    record(build(), log, sample_rate=0.0)
+    assert log.getvalue() == ""
+
+
+def test_replay():
+    acl = build()
+    log = io.StringIO()
+    record(acl, log)
+    records = list(read_log(io.StringIO(log.getvalue())))
+
+    report = replay({"registry": acl.is_any_allowed}, records)
+    assert report.count == 7
+    assert report.mismatches == []
+    assert sum(report.histograms["registry"].values()) == 7
+
+    report = replay({"new": build(deny_guest=False).is_any_allowed},
+                    records)
+    assert [(r[0], r[2], engine, result)
+            for r, engine, result in report.mismatches] == [
+        (["guest"], "article", "new", True),
+        (["staff", "guest"], "article", "new", True),
+        (["staff", "guest"], ("site", 1), "new", True)]
+    assert "3 mismatches" in report.format()
+
+
+def test_replay_files(tmpdir):
+    log_path = os.path.join(str(tmpdir), "decisions.log")
+    registry_path = os.path.join(str(tmpdir), "policy.rbac")
+    with io.open(log_path, "w") as log:
+        record(build(), log)
+    with open(registry_path, "wb") as registry_file:
+        dump(build(), registry_file)
+
+    report = replay_files(log_path, registry_path, compiled=True,
+                          processes=2, chunk_size=3)
+    assert report.count == 7
+    assert sorted(report.elapsed) == ["compiled", "registry"]
+    assert report.mismatches == []
+
+
+def test_replay_assertion_kwargs():
+    acl = build()
+    acl.allow("guest", "edit", "article",
+              lambda acl, role, operation, resource, level: level > 1)
+    log = io.StringIO()
+    recorder = DecisionRecorder(log)
+    proxy = RecordingRegistry(acl, recorder)
+    for level in [1, 2]:
+        proxy.is_any_allowed(["guest"], "edit", "article", level=level)
+    proxy.is_any_allowed(["staff"], "view", "article")
+    recorder.flush()
+    records = list(read_log(io.StringIO(log.getvalue())))
+    assert [r[3] for r in records] == [None, True, True]
+    assert records[1][5] == {"level": 2}
+
+    def broken(roles, operation, resource, level=0):
+        if level:
+            raise RuntimeError("broken")
+        return True
+
+    report = replay({"registry": acl.is_any_allowed, "broken": broken},
+                    records)
+    assert report.mismatches == []
+    assert [(r[5], engine) for r, engine, error in report.errors] == [
+        ({"level": 1}, "broken"), ({"level": 2}, "broken")]
+    assert sum(report.histograms["registry"].values()) == 3
+    assert "2 errors" in report.format()
@@ -0,0 +1,109 @@
+from __future__ import absolute_import
+
+import pytest
+
+import rbac.acl
+import rbac.context
+import rbac.roleset
+
+
+@pytest.fixture
+def acl():
+    acl = rbac.acl.Registry()
+    acl.add_role('staff')
+    acl.add_role('editor', parents=['staff'])
+    acl.add_role('badguy', parents=['staff'])
+    acl.add_resource('article')
+
+    acl.allow('staff', 'view', 'article')
+    acl.allow('editor', 'edit', 'article')
+    acl.deny('badguy', None, 'article')
+    return acl
+
+
+@pytest.fixture
+def cache(acl):
+    return rbac.roleset.RoleSetCache(acl)
+
+
+def test_role_set():
+    role_set = rbac.roleset.RoleSet(['editor', 'staff', 'editor'])
+    assert list(role_set) == ['editor', 'staff']
+    assert role_set == rbac.roleset.RoleSet(['editor', 'staff'])
+    assert role_set == rbac.roleset.RoleSet(['staff', 'editor'])
+    assert role_set != rbac.roleset.RoleSet(['editor'])
+    assert hash(role_set) == hash(rbac.roleset.RoleSet(['staff', 'editor']))
+    assert repr(role_set) == "RoleSet(['editor', 'staff'])"
+
+
+def test_intern(cache):
+    role_set = cache.intern(['staff', 'editor'])
+    assert cache.intern(['staff', 'editor']) is role_set
+    assert cache.intern(iter(['staff', 'editor'])) is role_set
+    assert cache.intern(['staff', 'editor', 'staff']) is role_set
+    assert cache.intern(role_set) is role_set
+
+    # the order of roles doesn't make a new combination, and the first
+    # given order is kept for evaluation
+    assert cache.intern(['editor', 'staff']) is role_set
+    assert cache.intern(rbac.roleset.RoleSet(['editor', 'staff'])) \
+        is role_set
+    assert list(role_set) == ['staff', 'editor']
+    assert cache.intern(['editor']) is not role_set
+
+
+def test_cached_permissions(acl, cache):
+    calls = []
+    is_any_allowed = acl.is_any_allowed
+
+    def counted_is_any_allowed(*args, **kwargs):
+        calls.append(args)
+        return is_any_allowed(*args, **kwargs)
+
+    acl.is_any_allowed = counted_is_any_allowed
+
+    for _ in range(3):
+        assert cache.is_any_allowed(['staff', 'editor'], 'edit', 'article')
+        assert cache.is_any_allowed(['editor', 'staff'], 'edit', 'article')
+        assert not cache.is_any_allowed(['staff', 'badguy'], 'view',
+                                        'article')
+    assert len(calls) == 2
+
+    # changing the acl drops the cached results
+    acl.deny('editor', 'edit', 'article')
+    assert not cache.is_any_allowed(['staff', 'editor'], 'edit', 'article')
+    assert len(calls) == 3
+
+
+def test_assertion_not_cached(acl, cache):
+    db = {'owner': 'tom'}
+
+    def is_owner(acl, role, operation, resource):
+        return db['owner'] == 'tony'
+
+    acl.allow('staff', 'delete', 'article', is_owner)
+    assert not cache.is_any_allowed(['staff'], 'delete', 'article')
+    db['owner'] = 'tony'
+    assert cache.is_any_allowed(['staff'], 'delete', 'article')
+
+    # the rules are scanned for assertions once per access
+    acl.add_resource('news', parents=['article'])
+    scans = []
+    is_assertion_free = acl._is_assertion_free
+    acl._is_assertion_free = lambda *args: scans.append(args) or \
+        is_assertion_free(*args)
+    for _ in range(3):
+        assert cache.is_any_allowed(['staff'], 'delete', 'news')
+    assert len(scans) == 1
+
+
+def test_identity_context(acl, cache):
+    context = rbac.context.IdentityContext(acl, role_sets=cache)
+    context.set_roles_loader(lambda: iter(['staff', 'editor']))
+    assert context.has_permission('edit', 'article')
+    assert context.has_permission('view', 'article')
+
+    context.set_roles_loader(lambda: ['staff', 'badguy'])
+    assert not context.has_permission('view', 'article')
+    with pytest.raises(rbac.context.PermissionDenied):
+        context.check_permission('view', 'article').check()
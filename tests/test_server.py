@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+import asyncio
+import os
+
+import pytest
+
+from rbac.acl import Registry
+from rbac.server import DecisionClient, DecisionServer
+
+
+@pytest.fixture
+def acl():
+    acl = Registry()
+    acl.add_role("staff")
+    acl.add_role("editor", parents=["staff"])
+    acl.add_resource("article")
+    acl.allow("staff", "view", "article")
+    acl.allow("editor", "edit", "article")
+    acl.deny("staff", "delete", "article")
+    acl.allow("editor", "review", "article",
+              lambda acl, role, op, res, level: level > 1)
+    return acl
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_tcp(acl):
+    server = DecisionServer(acl)
+    batches = []
+    evaluate = server.evaluate
+    server.evaluate = lambda checks: batches.append(checks) or \
+        evaluate(checks)
+
+    async def scenario():
+        await server.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        client = DecisionClient(port=port, pool_size=2)
+        try:
+            results = await asyncio.gather(*[
+                client.is_any_allowed(["staff"], "view", "article"),
+                client.is_any_allowed(["editor"], "edit", "article"),
+                client.is_any_allowed(["staff"], "edit", "article"),
+                client.is_any_allowed(["editor"], "delete", "article"),
+                client.is_any_allowed(["editor"], "review", "article",
+                                      level=2),
+                client.is_any_allowed(["editor"], "review", "article",
+                                      level=1),
+            ])
+            many = await client.check_many([
+                (["staff", "editor"], "edit", "article"),
+                (["staff"], "view", None)])
+        finally:
+            client.close()
+            server.close()
+            await client.wait_closed()
+            await server.wait_closed()
+        return results, many
+
+    results, many = run(scenario())
+    assert results == [True, True, False, False, True, None]
+    assert many == [True, False]
+    # the concurrent checks are coalesced
+    assert len(batches) < 7
+
+
+def test_unix_socket(acl, tmpdir):
+    path = os.path.join(str(tmpdir), "rbac.sock")
+    server = DecisionServer(acl)
+
+    async def scenario():
+        await server.start(path=path)
+        client = DecisionClient(path=path)
+        try:
+            allowed = await client.is_any_allowed(["staff"], "view",
+                                                  "article")
+            with pytest.raises(RuntimeError):
+                await client.is_any_allowed(["editor"], "review", "article",
+                                            unknown=1)
+            denied = await client.is_any_allowed(["editor"], "delete",
+                                                 "article")
+        finally:
+            client.close()
+            server.close()
+            await client.wait_closed()
+            await server.wait_closed()
+        return allowed, denied
+
+    assert run(scenario()) == (True, False)
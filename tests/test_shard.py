@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+
+import itertools
+import threading
+
+import pytest
+
+from rbac.acl import Registry
+from rbac.pattern import PathPattern
+from rbac.shard import ShardedRegistry
+
+
+def is_owner(acl, role, operation, resource, user=None):
+    return user == "owner"
+
+
+def build(acl):
+    acl.add_role("staff")
+    acl.add_role("editor", parents=["staff"])
+    acl.add_role("guest")
+    acl.add_operation("edit", parents=["view"])
+    for tenant in ["t1", "t2", "t3", "t4"]:
+        acl.add_resource(tenant)
+        acl.add_resource(tenant + "/docs", parents=[tenant])
+        acl.add_resource(tenant + "/docs/a", parents=[tenant + "/docs"])
+    acl.allow("staff", "view", "t1")
+    acl.allow("editor", "edit", "t2/docs")
+    acl.deny("editor", "view", "t2/docs/a")
+    acl.allow("guest", "view", PathPattern("*/docs/**"))
+    acl.deny("guest", "view", "t3/docs/a")
+    acl.allow(None, "edit", "t4", is_owner)
+    acl.deny("staff", "delete", None)
+
+
+@pytest.fixture
+def sharded():
+    acl = ShardedRegistry(shards=3)
+    build(acl)
+    yield acl
+    acl.close()
+
+
+def test_sharded_checks(sharded):
+    acl = Registry()
+    build(acl)
+
+    checks = [
+        (roles, operation, resource)
+        for roles in [["staff"], ["editor"], ["guest"], ["guest", "staff"]]
+        for operation in ["view", "edit", "delete"]
+        for resource in sorted(acl._resources)]
+    expected = [acl.is_any_allowed(*check) for check in checks]
+    assert sharded.check_many(checks) == expected
+    assert [sharded.is_any_allowed(*check) for check in checks] == expected
+
+    for role, resource in itertools.product(
+            ["staff", "editor", "guest"], acl._resources):
+        assert sharded.is_allowed(role, "view", resource) == \
+            acl.is_allowed(role, "view", resource)
+    assert sharded.is_allowed("guest", "edit", "t4/docs", user="owner")
+
+
+def test_partitioning(sharded):
+    # each resource tree belongs to one shard
+    for tenant in ["t1", "t2", "t3", "t4"]:
+        assert sharded.shard_of(tenant + "/docs/a") == \
+            sharded.shard_of(tenant)
+    stats = sharded.stats()
+    assert sum(s["resources"] for s in stats) == 12
+    # the rules of resources are kept once, the others are replicated
+    assert sum(s["rules"] for s in stats) == 5 + 2 * 3
+
+    other = next(t for t in ["t1", "t2", "t3", "t4"]
+                 if sharded.shard_of(t) != sharded.shard_of("t1"))
+    with pytest.raises(ValueError):
+        sharded.add_resource("shared", parents=["t1", other])
+    with pytest.raises(ValueError):
+        sharded.allow("staff", "view", "unknown")
+    with pytest.raises(AssertionError):
+        sharded.allow("nobody", "view", "t1")
+
+
+def test_failed_broadcast_is_drained(sharded):
+    with pytest.raises(AssertionError):
+        sharded.allow("nobody", "view", None)
+    assert sharded.is_allowed("staff", "view", "t1")
+    assert sharded.is_allowed("staff", "view", "t3") is None
+    assert sharded.check_many([(["staff"], "view", "t1"),
+                               (["guest"], "view", "t3/docs")]) == [
+        True, True]
+
+
+def test_concurrent_calls():
+    acl = ShardedRegistry(shards=3)
+    build(acl)
+    # the checks of the later shards come first
+    checks = sorted(([["staff"], "view", resource]
+                     for resource in ["t1", "t2", "t3", "t4"]),
+                    key=lambda check: -acl.shard_of(check[2]))
+    assert len(set(acl.shard_of(check[2]) for check in checks)) > 1
+
+    def scatter():
+        for _ in range(200):
+            acl.check_many(checks)
+
+    def broadcast():
+        for i in range(200):
+            acl.add_role("role-%d" % i)
+
+    threads = [threading.Thread(target=target)
+               for target in (scatter, broadcast)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    # a deadlocked registry could not be closed, so it is leaked
+    assert not any(thread.is_alive() for thread in threads)
+    acl.close()
@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+
+import threading
+
+import pytest
+
+import rbac.acl
+import rbac.tenant
+
+
+@pytest.fixture
+def base():
+    acl = rbac.acl.Registry()
+    acl.add_role('member')
+    acl.add_role('admin', parents=['member'])
+    acl.add_resource('billing')
+    acl.allow('member', 'view', 'billing')
+    acl.allow('admin', None, None)
+    return acl
+
+
+@pytest.fixture
+def loaded():
+    return []
+
+
+@pytest.fixture
+def tenants(base, loaded):
+    def load_tenant(tenant, acl):
+        loaded.append(tenant)
+        acl.add_role('%s-owner' % tenant, parents=['member'])
+        acl.add_resource('%s-project' % tenant)
+        acl.allow('%s-owner' % tenant, 'edit', '%s-project' % tenant)
+        acl.deny('member', 'view', 'billing')
+
+    return rbac.tenant.TenantRegistry(base, load_tenant, maxsize=2)
+
+
+def test_partitions(base, tenants):
+    assert tenants.is_allowed('a', 'a-owner', 'edit', 'a-project')
+    assert not tenants.is_allowed('a', 'member', 'edit', 'a-project')
+    assert tenants.is_allowed('a', 'admin', 'edit', 'a-project')
+    assert not tenants.is_allowed('a', 'a-owner', 'view', 'billing')
+    assert tenants.is_any_allowed('b', ['member', 'b-owner'], 'edit',
+                                  'b-project')
+
+    # the partitions don't see each other and don't change the base
+    assert 'b-owner' not in tenants.tenant('a')._roles
+    assert 'a-owner' not in base._roles
+    assert base.is_allowed('member', 'view', 'billing')
+
+    # the global rules are shared by all tenants
+    base.add_resource('report')
+    base.allow('member', 'print', 'report')
+    assert tenants.is_allowed('a', 'a-owner', 'print', 'report')
+    assert tenants.is_allowed('b', 'b-owner', 'print', 'report')
+
+
+def test_eviction(tenants, loaded):
+    for tenant in ['a', 'b', 'a', 'c', 'a', 'b']:
+        assert tenants.is_allowed(tenant, '%s-owner' % tenant, 'edit',
+                                  '%s-project' % tenant)
+    assert loaded == ['a', 'b', 'c', 'b']
+    assert len(tenants) == 2
+    assert 'a' in tenants and 'c' not in tenants
+
+    tenants.evict('a')
+    assert 'a' not in tenants
+    tenants.tenant('a')
+    assert loaded[-1] == 'a'
+
+
+def test_without_loader(base):
+    tenants = rbac.tenant.TenantRegistry(base, maxsize=1)
+    tenants.tenant('a').deny('admin', 'delete', 'billing')
+    tenants.tenant('b').add_role('auditor', parents=['member'])
+
+    # the partitions could not be loaded again, so they are kept
+    assert len(tenants) == 2
+    assert not tenants.is_allowed('a', 'admin', 'delete', 'billing')
+    assert tenants.is_allowed('b', 'admin', 'delete', 'billing')
+    assert tenants.is_allowed('b', 'auditor', 'view', 'billing')
+
+
+def test_base_changes(base, tenants):
+    tenants.tenant('a').add_role('a-guest')
+    base.allow(None, 'export', 'billing')
+    assert tenants.is_any_allowed('a', ['a-guest'], 'export', 'billing')
+    base.allow('member', 'pay', 'billing')
+    assert tenants.is_any_allowed('a', ['a-owner'], 'pay', 'billing')
+
+
+def test_slow_loader(base):
+    started = threading.Event()
+    released = threading.Event()
+
+    def load_tenant(tenant, acl):
+        if tenant == 'slow':
+            started.set()
+            released.wait(5)
+        acl.add_role('%s-owner' % tenant, parents=['member'])
+
+    tenants = rbac.tenant.TenantRegistry(base, load_tenant)
+    loading = threading.Thread(target=tenants.tenant, args=('slow',))
+    loading.start()
+    try:
+        assert started.wait(5)
+        # the other tenants are not blocked by the slow one
+        assert tenants.is_allowed('a', 'a-owner', 'view', 'billing')
+        assert 'slow' not in tenants
+    finally:
+        released.set()
+        loading.join()
+    assert tenants.is_allowed('slow', 'slow-owner', 'view', 'billing')